@@ -8,8 +8,8 @@ Architect 3D Home Modeler – Flask 3.x single-file app
 - Slideshow for 2+ favorites
 - Voice prompt (Web Speech API)
 - Dark mode toggle per rendering (CSS filter)
-- @app.before_request + guard for one-time init (Flask 3.x safe)
-- Auto-scaffold templates/ and static/ on first run
+- One-time FS/DB init at import (also exposed as `flask init`)
+- Templates served from memory; static/ auto-scaffolded on first run
 # ---------Recent Updates 08222025 v4 -----------
 - AGGRESSIVE PROMPT RE-ENGINEERING: Prompts are now framed as commands to the AI for maximum realism and context-awareness.
 - Front exteriors are now strictly commanded to include driveways/garages and exclude all backyard elements.
@@ -19,23 +19,56 @@ Architect 3D Home Modeler – Flask 3.x single-file app
 """
 
 import os
+import asyncio
 import sqlite3
 import uuid
 import json
 import base64
 import re
-from datetime import datetime
-from functools import wraps
+import time
+import queue
+import threading
+import hashlib
+import errno
+import shutil
+import zipfile
+import unicodedata
+import atexit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, lru_cache
 from pathlib import Path
-from io import BytesIO
+from datetime import timedelta
+from types import MappingProxyType
+from io import RawIOBase
 from email.utils import formataddr
 
 from flask import (
     Flask, request, render_template, redirect, url_for,
-    flash, session, send_from_directory, jsonify, abort
+    flash, session, jsonify, g, Response,
+    stream_template, get_flashed_messages
 )
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from markupsafe import Markup, escape
+from email_validator import validate_email, EmailNotValidError
+
+try:
+    import orjson
+    def dumps_json(obj) -> str:
+        return orjson.dumps(obj).decode()
+    loads_json = orjson.loads
+except ImportError:
+    orjson = None
+    def dumps_json(obj) -> str:
+        return json.dumps(obj, separators=(',', ':'))
+    loads_json = json.loads
 from PIL import Image
+import httpx
 from email.message import EmailMessage
 import smtplib
 
@@ -46,17 +79,75 @@ DB_PATH = BASE_DIR / "architect.db"
 UPLOAD_DIR = BASE_DIR / "uploads"
 RENDER_DIR = BASE_DIR / "static" / "renderings"
 STATIC_DIR = BASE_DIR / "static"
-TEMPLATES_DIR = BASE_DIR / "templates"
+PROMPT_CACHE_DIR = BASE_DIR / "prompt_cache"
 
 # Create Flask app
-app = Flask(__name__, template_folder=str(TEMPLATES_DIR), static_folder=str(STATIC_DIR))
+app = Flask(__name__, static_folder=str(STATIC_DIR))
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify/request.get_json through orjson; Flask's `default` still covers dates, dataclasses, Markup."""
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+# Templates only change when the scaffold is rewritten at start-up: no per-render stat, and
+# compiled bytecode is shared across workers/restarts. Must be set before jinja_env is first built.
+# directory=None: Jinja's own per-user temp dir, created 0700 and refused if someone else owns it
+# (cache files are unmarshalled as code, so a shared or guessable path would let others plant them).
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_options = {**app.jinja_options, "cache_size": 400,
+                     "bytecode_cache": FileSystemBytecodeCache(directory=None, pattern="%s.cache")}
 
 # Secret key
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY") or os.urandom(32)
+app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=int(os.getenv("SESSION_DAYS") or "14"))
+
+# Behind a reverse proxy (Render, nginx) set PROXY_HOPS=1 to trust its X-Forwarded-* headers, so the
+# client address, https scheme and host are right (including the absolute links in emails).
+PROXY_HOPS = int(os.getenv("PROXY_HOPS") or "0")
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS, x_host=PROXY_HOPS)
+
+# Static files (renderings included) already go out via wsgi.file_wrapper, i.e. sendfile(2) under
+# gunicorn. Behind nginx/apache with X-Sendfile/X-Accel configured, set USE_X_SENDFILE=1 to hand
+# them to the proxy instead.
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE") in ("1", "true", "True")
+# nginx wants X-Accel-Redirect to an `internal` location instead (e.g. X_ACCEL_PREFIX=/internal/static/
+# with `location /internal/static/ { internal; alias /app/static/; }`); setting this implies USE_X_SENDFILE.
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX")
+if X_ACCEL_PREFIX:
+    app.config["USE_X_SENDFILE"] = True
+
+# Sessions are signed cookies by default. SESSION_REDIS_URL moves them server-side (needs
+# flask-session and redis), leaving only a session id in the cookie.
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL")
+if SESSION_REDIS_URL:
+    import redis
+    from flask_session import Session
+    app.config.update(SESSION_TYPE="redis", SESSION_REDIS=redis.from_url(SESSION_REDIS_URL))
+    Session(app)
+
+# Page cache (anonymous landing page only)
+app.config.setdefault("CACHE_TYPE", "SimpleCache")
+cache = Cache(app)
+
+# Scaffold static assets on start-up. Set A3_BOOTSTRAP=0 where they are baked into the image.
+BOOTSTRAP = os.getenv("A3_BOOTSTRAP", "1") != "0"
 
 # One-time init guard
 app.config.setdefault("DB_INITIALIZED", False)
 app.config.setdefault("FS_INITIALIZED", False)
+app.config.setdefault("BATCH_POLLER_STARTED", False)
 
 # Email envs
 MAIL_SERVER = os.getenv("MAIL_SERVER")
@@ -66,51 +157,145 @@ MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
 MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "1") in ("1", "true", "True")
 MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER") or f"no-reply@{APP_NAME.replace(' ', '').lower()}.local"
 
+# Password hashing: any werkzeug method string, e.g. "pbkdf2:sha256:600000" to tune the
+# iteration count instead. Stored hashes carry their method, so changing it needs no migration.
+PWHASH_METHOD = os.getenv("PWHASH_METHOD", "scrypt:32768:8:1")
+# Verified against when the email is unknown, so a failed login costs the same either way
+# and response time doesn't reveal which addresses are registered.
+DUMMY_PWHASH = generate_password_hash(os.urandom(16).hex(), method=PWHASH_METHOD)
+PWHASH_PREFIX = DUMMY_PWHASH.split("$", 1)[0]  # method as werkzeug normalizes it, e.g. "scrypt:32768:8:1"
+
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY") or "5")
+IMAGE_FETCH_DEADLINE = float(os.getenv("IMAGE_FETCH_DEADLINE") or "600")  # seconds per image download
+OPENAI_TIMEOUT = 60.0  # seconds per API call
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL") or "60")
+# Images-per-minute this process may request (account limit / worker processes). 0 = unthrottled.
+IMAGES_RPM = int(os.getenv("IMAGES_RPM") or "0")
+# Interactive renders run on a worker pool and the browser polls /job/<id>. RENDER_ASYNC=0 runs
+# them inline in the request instead (same responses, handy for debugging).
+RENDER_ASYNC = os.getenv("RENDER_ASYNC", "1") != "0"
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS") or "4")
+# A job still pending after this long belongs to a worker that died or restarted: report it failed.
+RENDER_JOB_DEADLINE = int(os.getenv("RENDER_JOB_DEADLINE") or str(int(IMAGE_FETCH_DEADLINE + 2 * OPENAI_TIMEOUT)))
+# Reuse the image for an identical prompt instead of paying for a new one: a repeat of the same
+# room and options gets the same picture back. "Regenerate" on a rendering always asks OpenAI
+# for a new one. PROMPT_CACHE=0 disables the cache entirely.
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") != "0"
+# `flask sweep` drops cache entries not used for this many days.
+PROMPT_CACHE_DAYS = int(os.getenv("PROMPT_CACHE_DAYS") or "30")
+
+# SQLite
+# Idle connections kept per process. Any thread past this opens and closes its own connection per
+# request, so cover the request threads plus the render workers and batch poller.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or str(RENDER_WORKERS + 12))
 if not OPENAI_API_KEY:
     print("WARNING: OPENAI_API_KEY not set. Image generation will fail until you set it.")
 
+try:
+    import h2  # noqa: F401  (httpx[http2]) lets OpenAI calls share one multiplexed connection
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+OPENAI_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=40)
+
 # Use OpenAI Images API via latest SDK
 try:
-    from openai import OpenAI
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    from openai import OpenAI, AsyncOpenAI
+    # One pooled client per process, so batch uploads/polls reuse their TLS connection.
+    _openai_http = httpx.Client(http2=HTTP2, timeout=OPENAI_TIMEOUT, limits=OPENAI_LIMITS)
+    atexit.register(_openai_http.close)
+    openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=_openai_http)
 except Exception as e:
     openai_client = None
+    AsyncOpenAI = None
     print("OpenAI SDK not available yet:", e)
 
+# Background filesystem work (file deletes) so it stays off the request path
+IO_WORKERS = 4
+_io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+# SMTP sends (JPEG conversion + network) run here so bulk email returns without waiting on them
+_email_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="email")
+# Single-image renders for /generate_room and /modify_rendering (see enqueue_render)
+_render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+
 # ---------- Helpers ----------
 
 def init_fs_once():
-    """Make sure folders & templates exist once."""
+    """Make sure folders & static assets exist once."""
     if not app.config["FS_INITIALIZED"]:
-        for p in [UPLOAD_DIR, RENDER_DIR, STATIC_DIR, TEMPLATES_DIR]:
+        for p in [UPLOAD_DIR, RENDER_DIR, STATIC_DIR, PROMPT_CACHE_DIR]:
             p.mkdir(parents=True, exist_ok=True)
-        write_template_files_if_missing()
-        write_basic_static_if_missing()
+        if BOOTSTRAP:
+            write_basic_static_if_missing()
+        for name in VERSIONED_STATIC:
+            path = STATIC_DIR / name
+            if path.is_file():
+                STATIC_VERSIONS[name] = hashlib.sha1(path.read_bytes()).hexdigest()[:8]
         app.config["FS_INITIALIZED"] = True
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def open_db():
+    # timeout = busy wait on a locked db; WAL keeps readers from blocking on the one writer.
+    # Queries are fixed strings (ids go through json_each), so a roomy statement cache means each
+    # is prepared once per connection and reused from then on.
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA cache_size=-65536;
+        PRAGMA foreign_keys=ON;
+    """)
     return conn
 
-def init_db_once():
-    """Initialize SQLite tables once (Flask 3-safe)."""
-    if app.config["DB_INITIALIZED"]:
+def get_db():
+    """Request-scoped connection checked out of the process pool (returned on teardown)."""
+    conn = g.get("_db")
+    if conn is None:
+        try:
+            conn = _db_pool.get_nowait()
+        except queue.Empty:
+            conn = open_db()
+        g._db = conn
+    return conn
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("_db", None)
+    if conn is None:
         return
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def close_pooled_dbs():
+    while True:
+        try:
+            _db_pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+# Timestamps are filled in by SQLite (UTC, ISO-8601) rather than bound from Python on every INSERT.
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ','now')"
+
+SCHEMA = {
+    "users": f"""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT UNIQUE NOT NULL,
         name TEXT,
         password_hash TEXT NOT NULL,
-        created_at TEXT NOT NULL
+        created_at TEXT NOT NULL DEFAULT ({SQL_NOW})
     )
-    """)
-    cur.execute("""
+    """,
+    "renderings": f"""
     CREATE TABLE IF NOT EXISTS renderings (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER, -- NULL for guest renderings
@@ -119,20 +304,92 @@ def init_db_once():
         options_json TEXT,
         prompt TEXT NOT NULL,
         image_path TEXT NOT NULL,
+        thumb_path TEXT, -- gallery-sized WEBP; NULL falls back to image_path
         liked INTEGER DEFAULT 0,
         favorited INTEGER DEFAULT 0,
-        created_at TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT ({SQL_NOW}),
         FOREIGN KEY(user_id) REFERENCES users(id)
     )
-    """)
-    conn.commit()
-    conn.close()
-    app.config["DB_INITIALIZED"] = True
+    """,
+    "batches": f"""
+    CREATE TABLE IF NOT EXISTS batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT UNIQUE NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL, -- OpenAI's batch status, or 'collecting' while a worker saves the output
+        jobs_json TEXT NOT NULL, -- custom_id -> {{category, subcategory, options, prompt}}; collected ones are removed
+        created_at TEXT NOT NULL DEFAULT ({SQL_NOW}),
+        completed_at TEXT,
+        claimed_at TEXT, -- when the collecting worker last made progress
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """,
+    "render_jobs": f"""
+    CREATE TABLE IF NOT EXISTS render_jobs (
+        id TEXT PRIMARY KEY, -- opaque id handed to the browser
+        user_id INTEGER, -- NULL for guest jobs
+        status TEXT NOT NULL DEFAULT 'pending', -- pending | done | error | expired
+        rendering_id INTEGER,
+        message TEXT, -- success message or error text
+        landing INTEGER NOT NULL DEFAULT 0, -- 1 for /generate's exteriors: shown as "Newly Generated"
+        created_at TEXT NOT NULL DEFAULT ({SQL_NOW}),
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """,
+}
 
-@app.before_request
-def before_request():
-    init_fs_once()
-    init_db_once()
+# Columns added after the first release, for databases created before them.
+ADDED_COLUMNS = (("renderings", "thumb_path", "TEXT"), ("batches", "claimed_at", "TEXT"),
+                 ("render_jobs", "landing", "INTEGER NOT NULL DEFAULT 0"))
+
+def migrate_created_at_default(cur, table: str):
+    """Rebuild a table created before created_at had a DEFAULT (SQLite can't ALTER a column default)."""
+    cols = cur.execute(f"PRAGMA table_info({table})").fetchall()
+    if next(c for c in cols if c["name"] == "created_at")["dflt_value"] is not None:
+        return
+    names = ", ".join(c["name"] for c in cols)
+    cur.execute(SCHEMA[table].replace(f"IF NOT EXISTS {table} (", f"{table}_new ("))
+    cur.execute(f"INSERT INTO {table}_new ({names}) SELECT {names} FROM {table}")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+def init_db_once():
+    """Initialize SQLite tables once (Flask 3-safe)."""
+    if app.config["DB_INITIALIZED"]:
+        return
+    conn = get_db()
+    conn.execute("PRAGMA journal_mode=WAL")  # persistent: stored in the db file
+    # Table rebuilds drop a table other rows reference (SQLite's 12-step ALTER): enforcement off
+    # while they run, checked once before commit. Both pragmas are no-ops inside a transaction.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        cur = conn.cursor()
+        # IMMEDIATE takes the write lock up front, so workers booting together queue on the busy
+        # timeout instead of one failing when it upgrades from reading table_info to writing.
+        cur.execute("BEGIN IMMEDIATE")
+        for table, ddl in SCHEMA.items():
+            cur.execute(ddl)
+            migrate_created_at_default(cur, table)
+        for table, column, decl in ADDED_COLUMNS:
+            if not any(c["name"] == column for c in cur.execute(f"PRAGMA table_info({table})")):
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_rend_user_created ON renderings(user_id, created_at DESC)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_rend_fav_created ON renderings(user_id, created_at DESC) WHERE favorited = 1")
+        prune_render_jobs(cur)
+        violation = cur.execute("PRAGMA foreign_key_check").fetchone()
+        if violation:
+            raise sqlite3.IntegrityError(f"foreign key violation after migration: {tuple(violation)}")
+        conn.commit()
+    finally:
+        if conn.in_transaction:  # failed part-way: undo it so the pragmas below take effect
+            conn.rollback()
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+        conn.execute("PRAGMA foreign_keys=ON")
+    # Refresh planner statistics where they're missing or stale (cheap: SQLite only ANALYZEs
+    # what it judges would change a plan), so the user_id indexes keep winning as tables grow.
+    conn.execute("PRAGMA optimize")
+    app.config["DB_INITIALIZED"] = True
 
 def login_required(f):
     @wraps(f)
@@ -144,170 +401,287 @@ def login_required(f):
     return wrap
 
 def current_user():
-    if "user_id" in session:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE id = ?", (session["user_id"],))
-        row = cur.fetchone()
-        conn.close()
-        return row
-    return None
+    """The signed-in user's id/email/name, read from the session (queried once for older sessions)."""
+    if "user_id" not in session:
+        return None
+    user = session.get("user")
+    if user is None or user.get("id") != session["user_id"]:
+        row = get_db().execute("SELECT id, email, name FROM users WHERE id = ?", (session["user_id"],)).fetchone()
+        if row is None:
+            return None
+        user = session["user"] = dict(row)
+    return user
+
+# Rendering files are named by a fresh UUID and never rewritten, so browsers may cache them forever.
+RENDERINGS_URL_PREFIX = f"{app.static_url_path}/renderings/"
+
+# Scaffolded assets get a content hash in their URL (?v=), so they can be cached forever too.
+VERSIONED_STATIC = ("app.css", "app.js", "voice.js", "gallery.js")
+STATIC_VERSIONS = {}
+
+@app.url_defaults
+def version_static_urls(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        version = STATIC_VERSIONS.get(values.get("filename"))
+        if version:
+            values["v"] = version
+
+@app.after_request
+def cache_static(resp):
+    if resp.status_code in (200, 304) and (
+        request.path.startswith(RENDERINGS_URL_PREFIX)
+        or (request.endpoint == "static" and request.args.get("v"))
+    ):
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    if X_ACCEL_PREFIX and Path(resp.headers.get("X-Sendfile", "/")).is_relative_to(STATIC_DIR):
+        rel = Path(resp.headers.pop("X-Sendfile")).relative_to(STATIC_DIR)
+        resp.headers["X-Accel-Redirect"] = f"{X_ACCEL_PREFIX.rstrip('/')}/{rel.as_posix()}"
+    return resp
+
+# Favicon is tiny and requested constantly: a 16+32px icon generated once offline and embedded,
+# so it is served from memory with nothing read or drawn at runtime.
+FAVICON_BYTES = base64.b64decode(
+    "AAABAAIAEBAAAAAAIABNAgAAJgAAACAgAAAAACAA/gAAAHMCAACJUE5HDQoaCgAAAA1JSERSAAAAEAAAABAIBgAAAB/z/2EA"
+    "AAIUSURBVHicZZM7aBRRFIa/c2dmM7ubFYOtlWIh8QE+EUHEImIEU4kGbGwEiWtjYyOKEK0sLUQQRXQLm7gWktJSCBZBRdDa"
+    "QiHmze7O3nsszh2H4IFh4HD/58wVgLMzeiGr8SZ4EpSEOCL2hEA1gncJvhhwcf6xdGWyrVPO0VHINcQjgBMYBhgU0MzBVyQq"
+    "DgR6ITDtxDGnUFdfgRMHm30YrcOxcVheA+fMDSDqQaEujjmnAdSjyFZwqwG3r8LDNpw+AuubENScIYh6VAO4qCsCZBksrcLJ"
+    "g/BqFg7vtfz3r8ODNnhvsdLEMBAJREAFfv6CM0fh7jVo1g3snL1P7IfZGRgOYWXDnALI+ZuqxRDyEbg0AZcnIqi0G8d7SBJY"
+    "/A6v38PHzzDagLR0cOsKnDpkahrB3srCOQP7AAf2wO6dcO8JfPoGcu6GapqaZSfw9A40cv6b0kFnHp6/hR1j8GcFUhFj/r0E"
+    "20YrwKCA7gdYXofj+2B8V0W0ugFpZj248uNnWWw3TjGEZ1149BIWvlqMMm6aGliJHYDlVjUF763EsRasbYeRmu3A9qqVUEmg"
+    "gIhAq2mLVsMOF0MjSKK7+sg/AgUkjf+1COigQF68gyw1YH9ghS58gX7fCBZ/QF6Lgg5ksq1T4ugAefCwtomoGmOrYdl7fegN"
+    "jCCvofUcFHoamBbYep0TRyLRX5nbSVViUDyuus5/ARu621K82LlDAAAAAElFTkSuQmCCiVBORw0KGgoAAAANSUhEUgAAACAA"
+    "AAAgCAYAAABzenr0AAAAxUlEQVR4nO2XQRKDMAhFgenp2rPUw9Sz1OvZlTMZCoaAwiZ/pSbwnwSjIjA93/vOr12pbUVszynT"
+    "XPIgbSALgrLNOQRWmLei/pRzfT+FAId5BMINwE29EMM9YDF6LfZ8QxWw3uVINcwAoyW2zjcBeNfXEtcFiD5mvXi1CaPGkqTm"
+    "FCtwh7mW9w/gLnMtf3cfuALobF8IvwuiKgd4eAOlsnqWq7wCE2ACTID6z3L+r5apbUWk46DCHKDpgUyI1ou0gQxzAIAf8clK"
+    "Ew+YMVoAAAAASUVORK5CYII="
+)
+# /favicon.ico isn't versioned, so a week rather than a year; after that the ETag makes the recheck a 304.
+FAVICON_HEADERS = {"Cache-Control": "public, max-age=604800, immutable"}
+FAVICON_ETAG = hashlib.sha1(FAVICON_BYTES).hexdigest()[:16]
+
+@app.get("/favicon.ico")
+def favicon():
+    # A fresh Response per hit: a shared one would pick up per-visitor headers like Set-Cookie.
+    resp = Response(FAVICON_BYTES, mimetype="image/vnd.microsoft.icon", headers=FAVICON_HEADERS)
+    resp.set_etag(FAVICON_ETAG)
+    return resp.make_conditional(request)
 
 # ---------- Domain: Options & Prompting ----------
+# Choice lists shared by several rooms, defined once and referenced from OPTIONS.
+SIDING_MATERIALS = ("Brick", "Stucco", "Fiber-cement", "Wood plank", "Stone veneer")
+ROOF_STYLES = ("Gable", "Hip", "Flat parapet", "Dutch gable", "Modern shed")
+TRIM_COLORS = ("Matte black", "Crisp white", "Bronze", "Charcoal gray", "Forest green")
+LANDSCAPING = ("Boxwood hedges", "Desert xeriscape", "Lush tropical", "Minimalist gravel", "Cottage garden")
+WALL_PALETTE = ("Warm white", "Greige", "Deep navy", "Sage", "Charcoal")
+YES_NO = ("No", "Yes")
+FURNITURE_STYLES = ("Modern", "Transitional", "Traditional", "Scandinavian", "Industrial")
+LIVING_FLOORING = ("Wide oak", "Walnut herringbone", "Polished concrete", "Natural stone", "Eco bamboo")
+LIVING_LIGHTING = ("Recessed", "Chandelier", "Floor lamps", "Track", "Wall sconces")
+LOUNGE_CHAIRS = ("Lounge pair", "Wingback", "Accent swivel", "Mid-century", "Club chairs")
+BEDROOM_FLOORING = ("Plush carpet", "Wide oak", "Cork", "Laminate", "Engineered wood")
+BEDROOM_LIGHTING = ("Recessed", "Chandelier", "Wall sconces", "Ceiling fixture", "Bedside lamps")
+BED_STYLES = ("Upholstered", "Canopy", "Platform wood", "Metal frame", "Storage bed")
+CEILING_FANS = ("None", "Modern", "Wood blade", "Industrial", "Retractable")
+BATH_FLOORING = ("Porcelain tile", "Marble", "Terrazzo", "Natural stone", "Concrete")
+BATH_LIGHTING = ("Sconces", "Backlit mirror", "Recessed", "Pendant", "Chandelier")
+BATH_TILES = ("Subway", "Hex", "Slab stone", "Zellige", "Mosaic")
+MIRROR_STYLES = ("Framed", "Backlit", "Arched", "Round", "Edge-lit")
+BASEMENT_FLOORING = ("Carpet tile", "Vinyl plank", "Cork", "Concrete stain", "Rubber tile")
+BASEMENT_LIGHTING = ("Track", "Recessed", "Neon accent", "Pendant", "Sconces")
+
 OPTIONS = {
     "Front Exterior": {
-        "Siding Material": ["Brick", "Stucco", "Fiber-cement", "Wood plank", "Stone veneer"],
-        "Roof Style": ["Gable", "Hip", "Flat parapet", "Dutch gable", "Modern shed"],
-        "Window Trim Color": ["Matte black", "Crisp white", "Bronze", "Charcoal gray", "Forest green"],
-        "Landscaping": ["Boxwood hedges", "Desert xeriscape", "Lush tropical", "Minimalist gravel", "Cottage garden"],
-        "Vehicle": ["None", "Luxury sedan", "Pickup truck", "SUV", "Sports car"],
-        "Driveway Material": ["Concrete", "Pavers", "Gravel", "Stamped concrete", "Asphalt"],
-        "Driveway Shape": ["Straight", "Curved", "Circular", "Side-load", "Split"],
-        "Gate Style": ["No gate", "Modern slat", "Wrought iron", "Farm style", "Privacy panel"],
-        "Garage Style": ["Single", "Double", "Carriage", "Glass-paneled", "Side-load"]
+        "Siding Material": SIDING_MATERIALS,
+        "Roof Style": ROOF_STYLES,
+        "Window Trim Color": TRIM_COLORS,
+        "Landscaping": LANDSCAPING,
+        "Vehicle": ("None", "Luxury sedan", "Pickup truck", "SUV", "Sports car"),
+        "Driveway Material": ("Concrete", "Pavers", "Gravel", "Stamped concrete", "Asphalt"),
+        "Driveway Shape": ("Straight", "Curved", "Circular", "Side-load", "Split"),
+        "Gate Style": ("No gate", "Modern slat", "Wrought iron", "Farm style", "Privacy panel"),
+        "Garage Style": ("Single", "Double", "Carriage", "Glass-paneled", "Side-load")
     },
     "Back Exterior": {
-        "Siding Material": ["Brick", "Stucco", "Fiber-cement", "Wood plank", "Stone veneer"],
-        "Roof Style": ["Gable", "Hip", "Flat parapet", "Dutch gable", "Modern shed"],
-        "Window Trim Color": ["Matte black", "Crisp white", "Bronze", "Charcoal gray", "Forest green"],
-        "Landscaping": ["Boxwood hedges", "Desert xeriscape", "Lush tropical", "Minimalist gravel", "Cottage garden"],
-        "Swimming Pool": ["None", "Rectangular", "Freeform", "Infinity edge", "Lap pool"],
-        "Paradise Grills": ["None", "Compact island", "L-shaped", "U-shaped", "Pergola bar"],
-        "Basketball Court": ["None", "Half court", "Key only", "Sport tile pad", "Full court"],
-        "Water Fountain": ["None", "Tiered stone", "Modern sheetfall", "Bubbling urns", "Pond with jets"],
-        "Putting Green": ["None", "Single hole", "Two hole", "Wavy 3-hole", "Chipping fringe"]
+        "Siding Material": SIDING_MATERIALS,
+        "Roof Style": ROOF_STYLES,
+        "Window Trim Color": TRIM_COLORS,
+        "Landscaping": LANDSCAPING,
+        "Swimming Pool": ("None", "Rectangular", "Freeform", "Infinity edge", "Lap pool"),
+        "Paradise Grills": ("None", "Compact island", "L-shaped", "U-shaped", "Pergola bar"),
+        "Basketball Court": ("None", "Half court", "Key only", "Sport tile pad", "Full court"),
+        "Water Fountain": ("None", "Tiered stone", "Modern sheetfall", "Bubbling urns", "Pond with jets"),
+        "Putting Green": ("None", "Single hole", "Two hole", "Wavy 3-hole", "Chipping fringe")
     },
     "Living Room": {
-        "Flooring": ["Wide oak", "Walnut herringbone", "Polished concrete", "Natural stone", "Eco bamboo"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Recessed", "Chandelier", "Floor lamps", "Track", "Wall sconces"],
-        "Furniture Style": ["Modern", "Transitional", "Traditional", "Scandinavian", "Industrial"],
-        "Chairs": ["Lounge pair", "Wingback", "Accent swivel", "Mid-century", "Club chairs"],
-        "Coffee Tables": ["Marble slab", "Glass oval", "Reclaimed wood", "Nested set", "Stone drum"],
-        "Wine Storage": ["None", "Built-in wall", "Freestanding rack", "Glass wine room", "Under-stairs"],
-        "Fireplace": ["No", "Yes"],
-        "Door Style": ["French", "Pocket", "Barn", "Glass pivot", "Standard panel"]
+        "Flooring": LIVING_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": LIVING_LIGHTING,
+        "Furniture Style": FURNITURE_STYLES,
+        "Chairs": LOUNGE_CHAIRS,
+        "Coffee Tables": ("Marble slab", "Glass oval", "Reclaimed wood", "Nested set", "Stone drum"),
+        "Wine Storage": ("None", "Built-in wall", "Freestanding rack", "Glass wine room", "Under-stairs"),
+        "Fireplace": YES_NO,
+        "Door Style": ("French", "Pocket", "Barn", "Glass pivot", "Standard panel")
     },
     "Kitchen": {
-        "Flooring": ["Wide oak", "Walnut herringbone", "Polished concrete", "Porcelain tile", "Terrazzo"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Recessed", "Linear pendant", "Island pendants", "Ceiling fixtures", "Under-cabinet"],
-        "Cabinet Style": ["Shaker", "Flat-slab", "Inset", "Beaded", "Glass front"],
-        "Countertops": ["Quartz", "Marble", "Granite", "Butcher block", "Concrete"],
-        "Appliances": ["Stainless", "Panel-ready", "Black stainless", "Mixed metals", "Pro-grade"],
-        "Backsplash": ["Subway", "Herringbone", "Slab stone", "Zellige", "Hex tile"],
-        "Sink": ["Farmhouse", "Undermount SS", "Integrated stone", "Workstation", "Apron copper"],
-        "Island Lights": ["Three pendants", "Linear bar", "Two globes", "Can lights", "Mixed fixtures"]
+        "Flooring": ("Wide oak", "Walnut herringbone", "Polished concrete", "Porcelain tile", "Terrazzo"),
+        "Wall Color": WALL_PALETTE,
+        "Lighting": ("Recessed", "Linear pendant", "Island pendants", "Ceiling fixtures", "Under-cabinet"),
+        "Cabinet Style": ("Shaker", "Flat-slab", "Inset", "Beaded", "Glass front"),
+        "Countertops": ("Quartz", "Marble", "Granite", "Butcher block", "Concrete"),
+        "Appliances": ("Stainless", "Panel-ready", "Black stainless", "Mixed metals", "Pro-grade"),
+        "Backsplash": ("Subway", "Herringbone", "Slab stone", "Zellige", "Hex tile"),
+        "Sink": ("Farmhouse", "Undermount SS", "Integrated stone", "Workstation", "Apron copper"),
+        "Island Lights": ("Three pendants", "Linear bar", "Two globes", "Can lights", "Mixed fixtures")
     },
     "Home Office": {
-        "Flooring": ["Wide oak", "Carpet tile", "Polished concrete", "Cork", "Laminate"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Task lamp", "Track", "Recessed", "Pendant", "Wall sconces"],
-        "Desk Style": ["Standing", "Executive wood", "Minimalist metal", "L-shaped", "Dual sit-stand"],
-        "Office Chair": ["Ergonomic mesh", "Leather executive", "Task chair", "Stool", "Kneeling"],
-        "Storage": ["Open shelves", "Closed cabinets", "Mixed", "Credenza", "Wall system"]
+        "Flooring": ("Wide oak", "Carpet tile", "Polished concrete", "Cork", "Laminate"),
+        "Wall Color": WALL_PALETTE,
+        "Lighting": ("Task lamp", "Track", "Recessed", "Pendant", "Wall sconces"),
+        "Desk Style": ("Standing", "Executive wood", "Minimalist metal", "L-shaped", "Dual sit-stand"),
+        "Office Chair": ("Ergonomic mesh", "Leather executive", "Task chair", "Stool", "Kneeling"),
+        "Storage": ("Open shelves", "Closed cabinets", "Mixed", "Credenza", "Wall system")
     },
     "Primary Bedroom": {
-        "Flooring": ["Plush carpet", "Wide oak", "Cork", "Laminate", "Engineered wood"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Recessed", "Chandelier", "Wall sconces", "Ceiling fixture", "Bedside lamps"],
-        "Bed Style": ["Upholstered", "Canopy", "Platform wood", "Metal frame", "Storage bed"],
-        "Furniture Style": ["Modern", "Transitional", "Traditional", "Scandinavian", "Industrial"],
-        "Closet Design": ["Reach-in", "Walk-in", "Wardrobe wall", "His/Hers", "Island closet"],
-        "Ceiling Fan": ["None", "Modern", "Wood blade", "Industrial", "Retractable"]
+        "Flooring": BEDROOM_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BEDROOM_LIGHTING,
+        "Bed Style": BED_STYLES,
+        "Furniture Style": FURNITURE_STYLES,
+        "Closet Design": ("Reach-in", "Walk-in", "Wardrobe wall", "His/Hers", "Island closet"),
+        "Ceiling Fan": CEILING_FANS
     },
     "Primary Bathroom": {
-        "Flooring": ["Porcelain tile", "Marble", "Terrazzo", "Natural stone", "Concrete"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Sconces", "Backlit mirror", "Recessed", "Pendant", "Chandelier"],
-        "Vanity Style": ["Floating", "Furniture look", "Double", "Open shelf", "Integrated"],
-        "Shower or Tub": ["Large shower", "Freestanding tub", "Tub-shower", "Wet room", "Steam shower"],
-        "Tile Style": ["Subway", "Hex", "Slab stone", "Zellige", "Mosaic"],
-        "Bathroom Sink": ["Undermount", "Vessel", "Integrated", "Pedestal", "Trough"],
-        "Mirror Style": ["Framed", "Backlit", "Arched", "Round", "Edge-lit"],
-        "Balcony": ["No", "Yes"]
+        "Flooring": BATH_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BATH_LIGHTING,
+        "Vanity Style": ("Floating", "Furniture look", "Double", "Open shelf", "Integrated"),
+        "Shower or Tub": ("Large shower", "Freestanding tub", "Tub-shower", "Wet room", "Steam shower"),
+        "Tile Style": BATH_TILES,
+        "Bathroom Sink": ("Undermount", "Vessel", "Integrated", "Pedestal", "Trough"),
+        "Mirror Style": MIRROR_STYLES,
+        "Balcony": YES_NO
     },
     "Other Bedroom": {
-        "Flooring": ["Plush carpet", "Wide oak", "Cork", "Laminate", "Engineered wood"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Recessed", "Chandelier", "Wall sconces", "Ceiling fixture", "Bedside lamps"],
-        "Bed Style": ["Upholstered", "Canopy", "Platform wood", "Metal frame", "Storage bed"],
-        "Furniture Style": ["Modern", "Transitional", "Traditional", "Scandinavian", "Industrial"],
-        "Ceiling Fan": ["None", "Modern", "Wood blade", "Industrial", "Retractable"],
-        "Balcony": ["No", "Yes"]
+        "Flooring": BEDROOM_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BEDROOM_LIGHTING,
+        "Bed Style": BED_STYLES,
+        "Furniture Style": FURNITURE_STYLES,
+        "Ceiling Fan": CEILING_FANS,
+        "Balcony": YES_NO
     },
     "Half Bath": {
-        "Flooring": ["Porcelain tile", "Marble", "Terrazzo", "Natural stone", "Concrete"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Sconces", "Backlit mirror", "Recessed", "Pendant", "Chandelier"],
-        "Vanity Style": ["Floating", "Furniture look", "Single", "Pedestal", "Console"],
-        "Tile Style": ["Subway", "Hex", "Slab stone", "Zellige", "Mosaic"],
-        "Mirror Style": ["Framed", "Backlit", "Arched", "Round", "Edge-lit"]
+        "Flooring": BATH_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BATH_LIGHTING,
+        "Vanity Style": ("Floating", "Furniture look", "Single", "Pedestal", "Console"),
+        "Tile Style": BATH_TILES,
+        "Mirror Style": MIRROR_STYLES
     },
     "Basement: Game Room": {
-        "Flooring": ["Carpet tile", "Vinyl plank", "Cork", "Concrete stain", "Rubber tile"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Track", "Recessed", "Neon accent", "Pendant", "Sconces"],
-        "Pool Table": ["Classic wood", "Modern black", "Industrial", "Contemporary white", "Tournament"],
-        "Wine Bar": ["None", "Back bar", "Wet bar", "Island bar", "Wall niche"],
-        "Arcade Games": ["Pinball", "Racing", "Fighting", "Retro cabinets", "Skeeball"],
-        "Other Table Games": ["Air hockey", "Foosball", "Shuffleboard", "Darts", "Poker"]
+        "Flooring": BASEMENT_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BASEMENT_LIGHTING,
+        "Pool Table": ("Classic wood", "Modern black", "Industrial", "Contemporary white", "Tournament"),
+        "Wine Bar": ("None", "Back bar", "Wet bar", "Island bar", "Wall niche"),
+        "Arcade Games": ("Pinball", "Racing", "Fighting", "Retro cabinets", "Skeeball"),
+        "Other Table Games": ("Air hockey", "Foosball", "Shuffleboard", "Darts", "Poker")
     },
     "Basement: Gym": {
-        "Flooring": ["Rubber tile", "Vinyl plank", "Cork", "Foam mat", "Concrete seal"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Track", "Recessed", "Neon accent", "Pendant", "Sconces"],
-        "Equipment": ["Treadmill", "Bike", "Rowing", "Cable station", "Free weights"],
-        "Gym Station": ["Smith machine", "Power rack", "Functional trainer", "Multi-gym", "Calisthenics"],
-        "Steam Room": ["No", "Yes"]
+        "Flooring": ("Rubber tile", "Vinyl plank", "Cork", "Foam mat", "Concrete seal"),
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BASEMENT_LIGHTING,
+        "Equipment": ("Treadmill", "Bike", "Rowing", "Cable station", "Free weights"),
+        "Gym Station": ("Smith machine", "Power rack", "Functional trainer", "Multi-gym", "Calisthenics"),
+        "Steam Room": YES_NO
     },
     "Basement: Theater Room": {
-        "Flooring": ["Carpet tile", "Plush carpet", "Cork", "Laminate", "Acoustic floor"],
-        "Wall Color": ["Warm white", "Charcoal", "Burgundy", "Navy", "Chocolate brown"],
-        "Lighting": ["Step lights", "Wall sconces", "Star ceiling", "Recessed", "LED strips"],
-        "Wall Treatment": ["Acoustic panels", "Fabric", "Wood slats", "Velvet", "Painted drywall"],
-        "Seating": ["Recliners", "Sofas", "Stadium rows", "Bean bags", "Mixed"],
-        "Popcorn Machine": ["No", "Yes"],
-        "Sound System": ["5.1", "7.1", "Atmos", "Soundbar", "Hidden in-wall"],
-        "Screen Type": ["Projector", "MicroLED", "OLED", "Ultra-short-throw", "Acoustically transparent"],
-        "Movie Posters": ["No", "Yes"],
-        "Show Movie": ["No", "Yes"]
+        "Flooring": ("Carpet tile", "Plush carpet", "Cork", "Laminate", "Acoustic floor"),
+        "Wall Color": ("Warm white", "Charcoal", "Burgundy", "Navy", "Chocolate brown"),
+        "Lighting": ("Step lights", "Wall sconces", "Star ceiling", "Recessed", "LED strips"),
+        "Wall Treatment": ("Acoustic panels", "Fabric", "Wood slats", "Velvet", "Painted drywall"),
+        "Seating": ("Recliners", "Sofas", "Stadium rows", "Bean bags", "Mixed"),
+        "Popcorn Machine": YES_NO,
+        "Sound System": ("5.1", "7.1", "Atmos", "Soundbar", "Hidden in-wall"),
+        "Screen Type": ("Projector", "MicroLED", "OLED", "Ultra-short-throw", "Acoustically transparent"),
+        "Movie Posters": YES_NO,
+        "Show Movie": YES_NO
     },
     "Basement: Hallway": {
-        "Flooring": ["Carpet tile", "Vinyl plank", "Cork", "Concrete stain", "Rubber tile"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Track", "Recessed", "Neon accent", "Pendant", "Sconces"],
-        "Stairs": ["Open riser", "Closed", "Glass rail", "Wood rail", "Metal rail"]
+        "Flooring": BASEMENT_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": BASEMENT_LIGHTING,
+        "Stairs": ("Open riser", "Closed", "Glass rail", "Wood rail", "Metal rail")
     },
     "Family Room": {
-        "Flooring": ["Wide oak", "Walnut herringbone", "Polished concrete", "Natural stone", "Eco bamboo"],
-        "Wall Color": ["Warm white", "Greige", "Deep navy", "Sage", "Charcoal"],
-        "Lighting": ["Recessed", "Chandelier", "Floor lamps", "Track", "Wall sconces"],
-        "Furniture Style": ["Modern", "Transitional", "Traditional", "Scandinavian", "Industrial"],
-        "Chairs": ["Lounge pair", "Wingback", "Accent swivel", "Mid-century", "Club chairs"]
+        "Flooring": LIVING_FLOORING,
+        "Wall Color": WALL_PALETTE,
+        "Lighting": LIVING_LIGHTING,
+        "Furniture Style": FURNITURE_STYLES,
+        "Chairs": LOUNGE_CHAIRS
     }
 }
-BASIC_ROOMS = ["Living Room", "Kitchen", "Home Office", "Primary Bedroom", "Primary Bathroom", "Other Bedroom", "Half Bath", "Family Room"]
-BASEMENT_ROOMS = ["Basement: Game Room", "Basement: Gym", "Basement: Theater Room", "Basement: Hallway"]
-
-def build_room_list(description: str):
-    """Dynamically creates a list of rooms based on the home description."""
-    rooms = BASIC_ROOMS.copy()
-    if "basement" in (description or "").lower():
-        rooms.extend(BASEMENT_ROOMS)
+BASIC_ROOMS = ("Living Room", "Kitchen", "Home Office", "Primary Bedroom", "Primary Bathroom", "Other Bedroom", "Half Bath", "Family Room")
+BASEMENT_ROOMS = ("Basement: Game Room", "Basement: Gym", "Basement: Theater Room", "Basement: Hallway")
+
+# Same escapes `tojson` applies, so the pre-built string is safe inside <script>.
+_HTMLSAFE_JSON = str.maketrans({"<": "\\u003c", ">": "\\u003e", "&": "\\u0026", "'": "\\u0027"})
+
+# Static for the life of the process: serialize once instead of `tojson` on every gallery render.
+# Markup so templates emit it as-is without `|safe`.
+OPTIONS_JSON = Markup(dumps_json(OPTIONS).translate(_HTMLSAFE_JSON))
+# Option names per subcategory, for reading a form/job's selections without touching OPTIONS.
+OPTION_KEYS = {sub: tuple(opts) for sub, opts in OPTIONS.items()}
+EMPTY_OPTIONS_JSON = dumps_json({})
+
+def _option_tags(vals) -> Markup:
+    return Markup('<option value="">-- Default --</option>') + Markup("").join(
+        Markup('<option value="{0}">{0}</option>').format(v) for v in vals)
+
+# The modify form's <option> lists, built once: a card only marks its current choice (|mark_selected)
+# instead of looping every value of every option in Jinja for each rendering on the page.
+OPTION_SELECTS = MappingProxyType({sub: tuple((opt, _option_tags(vals)) for opt, vals in opts.items())
+                                   for sub, opts in OPTIONS.items()})
+
+# Description keyword -> extra rooms it unlocks. Leading \b only, so plurals ("basements") still match.
+ROOM_KEYWORDS = {"basement": BASEMENT_ROOMS}
+_ROOM_KEYWORD_RE = re.compile(r"\b(" + "|".join(map(re.escape, ROOM_KEYWORDS)) + ")", re.IGNORECASE)
+
+@lru_cache(maxsize=64)
+def room_keywords(description: str) -> list:
+    """The ROOM_KEYWORDS a home description mentions, in order of first mention."""
+    return list(dict.fromkeys(m.group(1).lower() for m in _ROOM_KEYWORD_RE.finditer(description or "")))
+
+@lru_cache(maxsize=64)
+def rooms_for_keywords(keywords: tuple) -> tuple:
+    rooms = BASIC_ROOMS
+    for keyword in keywords:
+        rooms += ROOM_KEYWORDS.get(keyword, ())
     return rooms
 
+def session_rooms():
+    # The session keeps just the matched keywords (a few bytes of cookie), not the whole room list.
+    return rooms_for_keywords(tuple(session.get("room_keywords", ())))
+
 def build_prompt(subcategory: str, options_map: dict, description: str, plan_uploaded: bool):
     """Builds a highly detailed and context-aware prompt for the AI."""
-    
+    # Sorted selections and collapsed whitespace: equivalent requests share one cache entry
+    # (and one prompt-cache key).
+    return _build_prompt_cached(subcategory, tuple(sorted(options_map.items())), " ".join((description or "").split()), plan_uploaded)
+
+_POOL_RE = re.compile(r"swimming pool|pool", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def _build_prompt_cached(subcategory: str, selections_items: tuple, description: str, plan_uploaded: bool):
     realism_command = "Create an ultra-realistic architectural photograph, not a 3D model rendering. Emulate a shot taken on a high-end DSLR camera (Canon EOS 5D) with a 35mm prime lens. The lighting should be soft, natural, and cinematic (golden hour lighting). Focus on photorealistic textures: the grain of the wood, the texture of brick, the reflection on glass."
-    selections = ", ".join([f"{k}: {v}" for k, v in options_map.items() if v and v not in ["None", ""]])
+    selections = ", ".join([f"{k}: {v}" for k, v in selections_items if v and v != "None"])
     plan_hint = "Use the uploaded architectural plan as a strict guide. " if plan_uploaded else ""
     
     view_context = ""
     if subcategory == "Front Exterior":
         view_context = "The camera angle MUST be from the street, looking towards the house. The composition MUST include the driveway leading to the garage, the main walkway, and the front door. CRITICAL EXCLUSIONS for Front Exterior: Absolutely NO backyard items. This means NO swimming pools, NO large patios with lounge chairs, NO paradise grills, NO pool houses. The scene must be a front yard ONLY."
-        description = re.sub(r'swimming pool|pool', '', description, flags=re.IGNORECASE)
+        description = _POOL_RE.sub('', description)
     elif subcategory == "Back Exterior":
         view_context = "The camera angle MUST be from the backyard, looking towards the rear of the house. Focus on outdoor living areas like patios, decks, or pools."
     else:
@@ -321,133 +695,658 @@ def build_prompt(subcategory: str, options_map: dict, description: str, plan_upl
     return base
 
 
+PLAN_MAX_EDGE = 1024
+
+def save_plan_upload(plan_file) -> Path:
+    """Persist an uploaded plan, downscaling raster scans to PLAN_MAX_EDGE (PDFs/unreadable files kept as-is)."""
+    plan_path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{secure_filename(plan_file.filename) or 'plan'}"
+    plan_file.save(plan_path)
+    if plan_path.suffix.lower() == ".pdf":
+        return plan_path
+    try:
+        with Image.open(plan_path) as img:
+            if max(img.size) <= PLAN_MAX_EDGE:
+                return plan_path
+            img.thumbnail((PLAN_MAX_EDGE, PLAN_MAX_EDGE), Image.LANCZOS)
+            resized_path = plan_path.with_suffix(".webp")
+            img.save(resized_path, "WEBP", quality=85)
+    except Exception as e:
+        print(f"Could not resize plan {plan_path.name}:", e)
+        return plan_path
+    if resized_path != plan_path:
+        plan_path.unlink(missing_ok=True)
+    return resized_path
+
+def _rm_many(paths: list):
+    for p in paths:
+        try:
+            p.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Could not remove {p}:", e)
+
+class _ZipSink(RawIOBase):
+    """Write-only, unseekable buffer that ZipFile streams into; drained between entries."""
+    def __init__(self):
+        self.chunks = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+def stream_zip(entries: list):
+    """Yield a ZIP of (static-relative path, name in archive) one entry at a time (stored: images are already compressed)."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for rel, arcname in entries:
+            path = STATIC_DIR / rel
+            if path.is_file():
+                zf.write(path, arcname=arcname)
+                yield sink.drain()
+    yield sink.drain()
+
 def save_image_bytes(png_bytes: bytes) -> str:
     uid = uuid.uuid4().hex
     filepath = RENDER_DIR / f"{uid}.png"
     with open(filepath, "wb") as f: f.write(png_bytes)
     return f"renderings/{filepath.name}"
 
-def generate_image_via_openai(prompt: str) -> str:
-    if openai_client is None or not OPENAI_API_KEY:
-        raise RuntimeError("OpenAI client not configured. Set OPENAI_API_KEY.")
+THUMB_EDGE = 512  # gallery columns are >= 300 CSS px, so this stays sharp on 1.5-2x screens
+
+def save_thumbnail(rel_path: str):
+    """Write a gallery-sized WEBP next to a saved rendering; returns its static path, or None if it can't be read."""
+    src = STATIC_DIR / rel_path
+    thumb = src.with_name(f"{src.stem}_thumb.webp")
     try:
-        result = openai_client.images.generate(model="dall-e-3", prompt=prompt, size="1024x1024", quality="hd", style="vivid", response_format="b64_json", n=1)
-        b64 = result.data[0].b64_json
-        if not b64: raise RuntimeError("No image data returned from OpenAI.")
-        return save_image_bytes(base64.b64decode(b64))
+        with Image.open(src) as img:
+            img.thumbnail((THUMB_EDGE, THUMB_EDGE), Image.LANCZOS)
+            # method 4 encodes ~3x faster than 6 for a barely visible difference at this size.
+            img.save(thumb, "WEBP", quality=80, method=4)
     except Exception as e:
-        raise RuntimeError(f"OpenAI image generation failed: {e}")
+        print(f"Could not thumbnail {src.name}:", e)
+        return None
+    return f"renderings/{thumb.name}"
+
+def save_rendering_b64(b64: str) -> tuple:
+    """Decode, write and thumbnail one base64 PNG as a single pool task: (image_path, thumb_path)."""
+    rel_path = save_image_bytes(base64.b64decode(b64))
+    return rel_path, save_thumbnail(rel_path)
+
+def image_request(prompt: str, response_format: str = "url") -> dict:
+    return dict(model="dall-e-3", prompt=prompt, size="1024x1024", quality="hd", style="vivid", response_format=response_format, n=1)
+
+async def adownload_image(http, url: str) -> str:
+    """Stream a generated image straight to disk (OpenAI image URLs expire, so persist immediately)."""
+    filepath = RENDER_DIR / f"{uuid.uuid4().hex}.png"
+    loop = asyncio.get_running_loop()
+    try:
+        async with http.stream("GET", url) as r:
+            r.raise_for_status()
+            with open(filepath, "wb") as f:
+                # Each chunk is written on the I/O pool while the next one downloads.
+                pending = None
+                async for chunk in r.aiter_bytes(65536):
+                    if pending: await pending
+                    pending = loop.run_in_executor(_io_pool, f.write, chunk)
+                if pending: await pending
+    except BaseException:  # includes cancellation by the fetch deadline: never leave a partial file
+        filepath.unlink(missing_ok=True)
+        raise
+    return f"renderings/{filepath.name}"
+
+class TokenBucket:
+    """Spaces out image requests to stay under IMAGES_RPM instead of collecting 429s and backoffs.
+
+    Only used on the OpenAI event loop, so it needs no lock.
+    """
+    def __init__(self, per_minute: int):
+        self.capacity = self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.stamp = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_image_bucket = TokenBucket(IMAGES_RPM) if IMAGES_RPM > 0 else None
+
+async def agenerate_image(client, http, prompt: str, sem: asyncio.Semaphore) -> str:
+    async with sem:
+        try:
+            if _image_bucket: await _image_bucket.acquire()
+            result = await client.images.generate(**image_request(prompt))
+            url = result.data[0].url
+            if not url: raise RuntimeError("No image URL returned from OpenAI.")
+            # Image URLs are short-lived, so bound the whole fetch, not just each read.
+            return await asyncio.wait_for(adownload_image(http, url), IMAGE_FETCH_DEADLINE)
+        except Exception as e:
+            raise RuntimeError(f"OpenAI image generation failed: {e}")
+
+_aio = {}
+_aio_lock = threading.Lock()
+
+def openai_runtime():
+    """The process's background event loop and its long-lived async clients, started on first use.
+
+    Async HTTP pools are bound to one loop, so every request's generations run on this loop
+    and reuse its warm connections instead of a fresh asyncio.run() (and TLS handshakes) each time.
+    """
+    with _aio_lock:
+        if not _aio:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openai-loop", daemon=True).start()
+            async def make_clients():
+                http = httpx.AsyncClient(http2=HTTP2, timeout=OPENAI_TIMEOUT, limits=OPENAI_LIMITS)
+                return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http), http
+            _aio["loop"] = loop
+            _aio["client"], _aio["http"] = asyncio.run_coroutine_threadsafe(make_clients(), loop).result()
+    return _aio["loop"], _aio["client"], _aio["http"]
+
+async def agenerate_images(client, http, prompts: list) -> list:
+    """Fire all prompts concurrently; returns a saved path or the exception per prompt, in order."""
+    sem = asyncio.Semaphore(IMAGE_CONCURRENCY)
+    return await asyncio.gather(*[agenerate_image(client, http, p, sem) for p in prompts], return_exceptions=True)
+
+# ---------- Prompt cache ----------
+# Content-addressed by the normalized prompt and kept outside static/. Every rendering gets its own
+# hard link (copy as fallback), so deleting a rendering never affects the cache or other renderings.
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(" ".join(prompt.split()).encode("utf-8")).hexdigest()
+
+def _link_or_copy(src: Path, dst: Path):
+    """Hard-link src at dst (which must not exist yet); copy only where the filesystem can't link."""
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise  # notably FileExistsError: never write into an existing name, it may share an inode
+        # Copy under a private name and swap it in, so no reader sees a partial file.
+        tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+def cached_rendering(prompt: str):
+    """Saved path of a fresh copy of the cached image for this prompt, or None on a miss."""
+    src = PROMPT_CACHE_DIR / f"{prompt_key(prompt)}.png"
+    dst = RENDER_DIR / f"{uuid.uuid4().hex}.png"
+    try:
+        _link_or_copy(src, dst)
+    except FileNotFoundError:  # not cached (or swept meanwhile)
+        return None
+    os.utime(src)  # last use, for sweep_command
+    return f"renderings/{dst.name}"
+
+def remember_rendering(prompt: str, rel_path: str):
+    dst = PROMPT_CACHE_DIR / f"{prompt_key(prompt)}.png"
+    try:
+        _link_or_copy(STATIC_DIR / rel_path, dst)
+    except FileExistsError:
+        pass  # a concurrent request for the same prompt cached it first
+    except OSError as e:
+        print("Could not cache rendering:", e)
+
+def generate_images_via_openai(prompts: list, fresh: bool = False) -> list:
+    """Saved path or exception per prompt, in order; only prompt-cache misses (or all, if fresh) reach OpenAI."""
+    results = [cached_rendering(p) if PROMPT_CACHE and not fresh else None for p in prompts]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        if AsyncOpenAI is None or not OPENAI_API_KEY:
+            raise RuntimeError("OpenAI client not configured. Set OPENAI_API_KEY.")
+        loop, client, http = openai_runtime()
+        fresh = asyncio.run_coroutine_threadsafe(agenerate_images(client, http, [prompts[i] for i in misses]), loop).result()
+        for i, r in zip(misses, fresh):
+            results[i] = r
+            if PROMPT_CACHE and not isinstance(r, Exception):
+                remember_rendering(prompts[i], r)
+    return results
+
+def generate_image_via_openai(prompt: str, fresh: bool = False) -> str:
+    result = generate_images_via_openai([prompt], fresh)[0]
+    if isinstance(result, Exception): raise result
+    return result
+
+# ---------- Render jobs (interactive, one image each) ----------
+def run_render_job(job_id: str, user_id, category: str, subcategory: str, selected: dict, prompt: str, message: str,
+                   fresh: bool = False):
+    with app.app_context():
+        conn = get_db()
+        try:
+            rel_path = generate_image_via_openai(prompt, fresh)
+            thumb_path = save_thumbnail(rel_path)
+            new_id = conn.execute("""
+                INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, thumb_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id
+            """, (user_id, category, subcategory, dumps_json(selected), prompt, rel_path, thumb_path)).fetchone()[0]
+            if not conn.execute("UPDATE render_jobs SET status = 'done', rendering_id = ?, message = ? WHERE id = ? AND status = 'pending'",
+                                (new_id, message, job_id)).rowcount:
+                # job_status already reported this job as timed out: keep no rendering the user was told failed.
+                conn.rollback()
+                _rm_many([STATIC_DIR / p for p in (rel_path, thumb_path) if p])
+                return
+        except Exception as e:
+            conn.rollback()
+            conn.execute("UPDATE render_jobs SET status = 'error', message = ? WHERE id = ? AND status = 'pending'", (str(e), job_id))
+        conn.commit()
+
+# Jobs older than the deadline are either dead or finished but never polled (tab closed).
+STALE_JOB = f"created_at < strftime('%Y-%m-%dT%H:%M:%fZ','now','-{RENDER_JOB_DEADLINE} seconds')"
+
+def prune_render_jobs(cur) -> int:
+    return cur.execute(f"DELETE FROM render_jobs WHERE {STALE_JOB}").rowcount
+
+def enqueue_render(user_id, category: str, subcategory: str, selected: dict, prompt: str, message: str,
+                   fresh: bool = False, landing: bool = False) -> str:
+    """Record a pending job and hand the OpenAI call to the render pool; returns the job id to poll.
+    fresh skips the prompt cache (the user asked for a new take on an existing rendering);
+    landing marks the landing page's exteriors, which the gallery opens on."""
+    job_id = uuid.uuid4().hex
+    conn = get_db()
+    conn.execute("INSERT INTO render_jobs (id, user_id, landing) VALUES (?, ?, ?)", (job_id, user_id, landing))
+    conn.commit()
+    args = (job_id, user_id, category, subcategory, selected, prompt, message, fresh)
+    if RENDER_ASYNC:
+        _render_pool.submit(run_render_job, *args)
+    else:
+        run_render_job(*args)
+    return job_id
+
+# ---------- Batch API (bulk, non-interactive) ----------
+BATCH_PENDING_STATUSES = ("validating", "in_progress", "finalizing")
+# A collector that stops making progress this long (worker died, download failed) loses its claim.
+BATCH_CLAIM_LEASE = 600  # seconds
+# Every worker runs a poller, so a batch is claimed with one conditional UPDATE before its output
+# is saved: whichever worker changes the row collects it; the rest see rowcount 0 and skip it.
+COLLECTABLE_BATCH = (f"(status IN ({','.join(repr(s) for s in BATCH_PENDING_STATUSES)}) OR (status = 'collecting' "
+                     f"AND claimed_at < strftime('%Y-%m-%dT%H:%M:%fZ','now','-{BATCH_CLAIM_LEASE} seconds')))")
+PENDING_BATCHES_SQL = f"SELECT * FROM batches WHERE {COLLECTABLE_BATCH}"
+
+def submit_image_batch(jobs: dict) -> str:
+    """Upload one JSONL line per job and open a 24h Images batch; returns the batch id."""
+    if openai_client is None or not OPENAI_API_KEY:
+        raise RuntimeError("OpenAI client not configured. Set OPENAI_API_KEY.")
+    lines = [dumps_json({"custom_id": cid, "method": "POST", "url": "/v1/images/generations",
+                         "body": image_request(job["prompt"], "b64_json")}) for cid, job in jobs.items()]
+    batch_file = openai_client.files.create(file=("renderings.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+    batch = openai_client.batches.create(input_file_id=batch_file.id, endpoint="/v1/images/generations", completion_window="24h")
+    return batch.id
+
+def collect_batch(row) -> str:
+    """Check one pending batch; on completion save its images as renderings. Returns the new status."""
+    batch = openai_client.batches.retrieve(row["batch_id"])
+    if batch.status in BATCH_PENDING_STATUSES:
+        return batch.status
+
+    conn = get_db()
+    cur = conn.cursor()
+    claimed = cur.execute(f"UPDATE batches SET status='collecting', claimed_at={SQL_NOW} WHERE id=? AND {COLLECTABLE_BATCH}",
+                          (row["id"],)).rowcount
+    conn.commit()
+    if not claimed:  # another worker has (or already had) it
+        return cur.execute("SELECT status FROM batches WHERE id=?", (row["id"],)).fetchone()[0]
+    if batch.status == "completed" and batch.output_file_id:
+        # Re-read after claiming: a collector that died part-way already saved (and removed) some jobs.
+        jobs = loads_json(cur.execute("SELECT jobs_json FROM batches WHERE id=?", (row["id"],)).fetchone()[0])
+
+        def record(custom_id, job, future):
+            # Each rendering commits together with crossing its job off, so a resumed collect
+            # neither duplicates nor re-downloads what was already saved.
+            rel_path, thumb_path = future.result()
+            cur.execute("""
+                INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, thumb_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (row["user_id"], job["category"], job["subcategory"], dumps_json(job["options"]), job["prompt"], rel_path, thumb_path))
+            cur.execute(f"UPDATE batches SET jobs_json=json_remove(jobs_json, ?), claimed_at={SQL_NOW} WHERE id=?",
+                        (f'$."{custom_id}"', row["id"]))
+            conn.commit()
+
+        # The output file is read a line at a time and at most IO_WORKERS images are being decoded
+        # and written on the I/O pool; the oldest is recorded before another is submitted, so a
+        # large batch holds a handful of base64 payloads in memory, not all of them.
+        in_flight = deque()
+        with openai_client.files.with_streaming_response.content(batch.output_file_id) as output:
+            for line in output.iter_lines():
+                if not line.strip(): continue
+                entry = loads_json(line)
+                job = jobs.get(entry.get("custom_id"))
+                response = entry.get("response") or {}
+                if not job or response.get("status_code") != 200: continue
+                b64 = response["body"]["data"][0].get("b64_json")
+                if not b64: continue
+                if len(in_flight) >= IO_WORKERS:
+                    record(*in_flight.popleft())
+                in_flight.append((entry["custom_id"], job, _io_pool.submit(save_rendering_b64, b64)))
+        while in_flight:
+            record(*in_flight.popleft())
+    cur.execute(f"UPDATE batches SET status=?, completed_at={SQL_NOW} WHERE id=?", (batch.status, row["id"]))
+    conn.commit()
+    return batch.status
+
+def poll_batches_forever():
+    while True:
+        time.sleep(BATCH_POLL_INTERVAL)
+        with app.app_context():
+            conn = get_db()
+            rows = conn.execute(PENDING_BATCHES_SQL).fetchall()
+            for row in rows:
+                try:
+                    collect_batch(row)
+                except Exception as e:
+                    print(f"Batch {row['batch_id']} poll failed:", e)
+
+def ensure_batch_poller():
+    """Start the per-process batch poller thread once."""
+    if app.config["BATCH_POLLER_STARTED"] or openai_client is None:
+        return
+    app.config["BATCH_POLLER_STARTED"] = True
+    threading.Thread(target=poll_batches_forever, name="batch-poller", daemon=True).start()
 
 # ---------- Email ----------
-def send_email_with_images(to_email: str, subject: str, body: str, image_paths: list):
-    # (Implementation remains the same)
-    pass
+_smtp_local = threading.local()
+
+def smtp_connection():
+    """This email worker's SMTP session: kept open between messages, re-opened when the server dropped it."""
+    smtp = getattr(_smtp_local, "smtp", None)
+    if smtp is not None:
+        try:
+            if smtp.noop()[0] == 250:
+                return smtp
+        except (smtplib.SMTPException, OSError):
+            pass
+        smtp.close()
+        _smtp_local.smtp = None
+    smtp = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=30)
+    try:
+        if MAIL_USE_TLS:
+            smtp.starttls()
+        if MAIL_USERNAME:
+            smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+    except BaseException:
+        smtp.close()
+        raise
+    _smtp_local.smtp = smtp
+    return smtp
+
+def send_email_with_images(to_email: str, subject: str, body: str, links: list):
+    """Email (full_url, thumb_url) pairs as links and inline previews; no image bytes go through SMTP."""
+    if not MAIL_SERVER:
+        raise RuntimeError("Email is not configured. Set MAIL_SERVER.")
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = formataddr((APP_NAME, MAIL_DEFAULT_SENDER))
+    msg["To"] = to_email
+    msg.set_content(body + "\n\n" + "\n".join(full for full, _ in links))
+    previews = "".join(f'<p><a href="{escape(full)}"><img src="{escape(thumb)}" width="256" alt="Rendering"></a></p>'
+                       for full, thumb in links)
+    msg.add_alternative(f"<p>{escape(body)}</p>{previews}", subtype="html")
+
+    smtp = smtp_connection()
+    try:
+        smtp.send_message(msg)
+    except (smtplib.SMTPException, OSError):
+        # Don't trust the session after a failure; the retry starts from a fresh connection.
+        _smtp_local.smtp = None
+        smtp.close()
+        raise
+
+EMAIL_RETRIES = 3
+EMAIL_RETRY_DELAY = 30  # seconds, doubled per attempt
+
+def _send_email_in_background(to_email: str, subject: str, body: str, links: list):
+    for attempt in range(EMAIL_RETRIES + 1):
+        try:
+            send_email_with_images(to_email, subject, body, links)
+            return
+        except (smtplib.SMTPException, OSError) as e:  # transient: server/network trouble
+            if attempt == EMAIL_RETRIES:
+                print(f"Email to {to_email} failed after {attempt + 1} attempts:", e)
+                return
+            time.sleep(EMAIL_RETRY_DELAY * 2 ** attempt)
+        except Exception as e:
+            print(f"Email to {to_email} failed:", e)
+            return
 
 # ---------- Routes ----------
 
+def not_shareable():
+    """Only bare anonymous GETs may come from the page cache: users, flashes and guest badges live in the session."""
+    return request.method != "GET" or bool(session)
+
+SHAREABLE_PAGES = {"index", "login", "register"}
+
+@app.after_request
+def revalidate_shared_pages(resp):
+    # ETag so a reload is an empty 304; no-cache (not max-age) so a browser that just signed in
+    # never shows its stale anonymous copy. Reading the session here also adds Vary: Cookie.
+    if resp.status_code == 200 and request.endpoint in SHAREABLE_PAGES and not not_shareable():
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.add_etag()
+        resp.make_conditional(request)
+    return resp
+
 @app.route("/")
+@cache.cached(timeout=300, unless=not_shareable)
 def index():
     return render_template("index.html", app_name=APP_NAME, user=current_user(), basic_rooms=BASIC_ROOMS)
 
+# Guest renderings ride in the session cookie; keep only the newest so it stays small.
+GUEST_RENDERINGS_MAX = 50
+
+def remember_guest_renderings(ids):
+    session['guest_rendering_ids'] = [*session.get('guest_rendering_ids', []), *ids][-GUEST_RENDERINGS_MAX:]
+
 @app.post("/generate")
 def generate():
     description = request.form.get("description", "").strip()
     plan_file = request.files.get("plan_file")
     plan_uploaded = bool(plan_file and plan_file.filename)
     if plan_uploaded:
-        (UPLOAD_DIR / f"{uuid.uuid4().hex}_{plan_file.filename}").write_bytes(plan_file.read())
+        save_plan_upload(plan_file)
 
-    session['available_rooms'] = build_room_list(description)
+    session['room_keywords'] = room_keywords(description)
 
     user_id = session.get("user_id")
     new_rendering_ids = []
     
-    conn = get_db()
-    cur = conn.cursor()
-    
-    for subcat in ["Front Exterior", "Back Exterior"]:
-        try:
-            prompt = build_prompt(subcat, {}, description, plan_uploaded)
-            rel_path = generate_image_via_openai(prompt)
-            now = datetime.utcnow().isoformat()
-            cur.execute("""
-                INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, "EXTERIOR", subcat, json.dumps({}), prompt, rel_path, now))
-            conn.commit()
-            new_rendering_ids.append(cur.lastrowid)
-        except Exception as e:
-            conn.close()
-            flash(str(e), "danger")
-            return redirect(url_for("index"))
-    
-    conn.close()
-    
+    prompts = [(subcat, build_prompt(subcat, {}, description, plan_uploaded)) for subcat in ["Front Exterior", "Back Exterior"]]
+    if request.accept_mimetypes.best == "application/json":
+        # The landing page's script: both exteriors go to the render pool as jobs, so no request
+        # thread waits on OpenAI; the page polls /job/<id> and then moves on to the gallery.
+        job_ids = [enqueue_render(user_id, "EXTERIOR", subcat, {}, prompt, f"Generated {subcat} rendering!", landing=True)
+                   for subcat, prompt in prompts]
+        return jsonify({"job_ids": job_ids, "next": url_for("gallery" if user_id else "session_gallery")}), 202
+
+    # Without JavaScript the form posts normally and this request renders both.
+    try:
+        results = generate_images_via_openai([p for _, p in prompts])
+    except Exception as e:
+        flash(str(e), "danger")
+        return redirect(url_for("index"))
+
+    errors = [str(r) for r in results if isinstance(r, Exception)]
+    saved = [(subcat, prompt, rel_path) for (subcat, prompt), rel_path in zip(prompts, results) if not isinstance(rel_path, Exception)]
+    thumbs = _io_pool.map(save_thumbnail, [rel_path for _, _, rel_path in saved])
+    rows = [(user_id, "EXTERIOR", subcat, EMPTY_OPTIONS_JSON, prompt, rel_path, thumb)
+            for (subcat, prompt, rel_path), thumb in zip(saved, thumbs)]
+    if rows:
+        # Both exteriors in one statement and one commit.
+        conn = get_db()
+        values = ", ".join("(?, ?, ?, ?, ?, ?, ?)" for _ in rows)
+        new_rendering_ids = [r[0] for r in conn.execute(f"""
+            INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, thumb_path)
+            VALUES {values} RETURNING id
+        """, [v for row in rows for v in row]).fetchall()]
+        conn.commit()
+
+    for err in errors:
+        flash(err, "danger")
+    if not new_rendering_ids:
+        return redirect(url_for("index"))
+
     session['new_rendering_ids'] = new_rendering_ids
     if not user_id:
-        guest_ids = session.get('guest_rendering_ids', [])
-        guest_ids.extend(new_rendering_ids)
-        session['guest_rendering_ids'] = guest_ids
+        remember_guest_renderings(new_rendering_ids)
 
-    flash("Generated Front & Back exterior renderings!", "success")
+    if not errors:
+        flash("Generated Front & Back exterior renderings!", "success")
     return redirect(url_for("gallery" if user_id else "session_gallery"))
 
 @app.post("/generate_room")
 def generate_room():
     subcategory = request.form.get("subcategory")
     description = request.form.get("description", "")
-    selected = {opt_name: request.form.get(opt_name) for opt_name in OPTIONS.get(subcategory, {}).keys()}
+    selected = {opt_name: request.form.get(opt_name) for opt_name in OPTION_KEYS.get(subcategory, ())}
     prompt = build_prompt(subcategory, selected, description, False)
-    
+    job_id = enqueue_render(session.get("user_id"), "ROOM", subcategory, selected, prompt,
+                            f"Generated {subcategory} rendering!")
+    return jsonify({"job_id": job_id, "message": f"Generating {subcategory}..."}), 202
+
+JOB_STATUS_SQL = f"SELECT *, {STALE_JOB} AS overdue FROM render_jobs WHERE id = ?"
+
+@app.get("/job/<job_id>")
+def job_status(job_id):
+    conn = get_db()
+    row = conn.execute(JOB_STATUS_SQL, (job_id,)).fetchone()
+    if not row or row["user_id"] != session.get("user_id"):
+        return jsonify({"error": "Job not found."}), 404
+    if row["status"] == "pending":
+        if not row["overdue"]:
+            return jsonify({"status": "pending"})
+        # Give up on it, unless its worker finishes first. The row stays (pruned later) so a worker
+        # that is still running sees 'expired' and discards its result instead of recording it.
+        if conn.execute("UPDATE render_jobs SET status = 'expired' WHERE id = ? AND status = 'pending'", (job_id,)).rowcount:
+            conn.commit()
+        row = conn.execute(JOB_STATUS_SQL, (job_id,)).fetchone()
+    if row["status"] == "expired":
+        return jsonify({"status": "error", "error": "Rendering timed out. Please try again."}), 504
+
+    # Final state is delivered once; the row is no longer needed after that.
+    conn.execute("DELETE FROM render_jobs WHERE id = ?", (job_id,))
+    conn.commit()
+    if row["status"] == "error":
+        return jsonify({"status": "error", "error": row["message"]}), 500
+
+    new_id = row["rendering_id"]
+    if row["landing"]:
+        # The landing page moves on to the gallery next: open it on "Newly Generated", and say so
+        # there the way the no-JavaScript form post does.
+        session['new_rendering_ids'] = [*session.get('new_rendering_ids', []), new_id]
+        flash(row["message"], "success")
+    if not row["user_id"]:
+        remember_guest_renderings((new_id,))
+    return jsonify({"status": "done", "id": new_id, "message": row["message"]})
+
+@app.post("/queue_batch")
+@login_required
+def queue_batch():
+    """Queue many room renderings through the Batch API (cheaper, ≤24h turnaround)."""
+    payload = request.get_json(silent=True)
+    requested = payload.get("jobs") if isinstance(payload, dict) else None
+    if not isinstance(requested, list) or not all(isinstance(job, dict) for job in requested):
+        return jsonify({"error": "Expected {\"jobs\": [{\"subcategory\": ..., \"options\": {...}}, ...]}."}), 400
+    jobs = {}
+    for job in requested:
+        subcategory = job.get("subcategory")
+        if subcategory not in OPTION_KEYS: continue
+        options = job.get("options") or {}
+        description = job.get("description") or ""
+        if (not isinstance(options, dict) or not isinstance(description, str)
+                or not all(v is None or isinstance(v, str) for v in options.values())):
+            return jsonify({"error": f"Invalid options or description for {subcategory}."}), 400
+        selected = {opt: options.get(opt) for opt in OPTION_KEYS[subcategory]}
+        prompt = build_prompt(subcategory, selected, description, False)
+        category = "EXTERIOR" if subcategory in ("Front Exterior", "Back Exterior") else "ROOM"
+        jobs[uuid.uuid4().hex] = {"category": category, "subcategory": subcategory, "options": selected, "prompt": prompt}
+    if not jobs:
+        return jsonify({"error": "No valid rooms to queue."}), 400
+
     try:
-        rel_path = generate_image_via_openai(prompt)
+        batch_id = submit_image_batch(jobs)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": f"Batch submission failed: {e}"}), 500
 
-    user_id = session.get("user_id")
     conn = get_db()
-    cur = conn.cursor()
-    now = datetime.utcnow().isoformat()
-    cur.execute("""
-        INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, "ROOM", subcategory, json.dumps(selected), prompt, rel_path, now))
+    conn.execute("""
+        INSERT INTO batches (batch_id, user_id, status, jobs_json)
+        VALUES (?, ?, ?, ?)
+    """, (batch_id, session["user_id"], "validating", dumps_json(jobs)))
     conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
+    ensure_batch_poller()
 
-    if not user_id:
-        guest_ids = session.get('guest_rendering_ids', [])
-        guest_ids.append(new_id)
-        session['guest_rendering_ids'] = guest_ids
-    
-    return jsonify({"id": new_id, "path": url_for('static', filename=rel_path), "subcategory": subcategory, "message": f"Generated {subcategory} rendering!"})
+    return jsonify({"batch_id": batch_id, "queued": len(jobs), "message": f"Queued {len(jobs)} rendering(s); they will appear in your gallery when the batch completes."}), 202
+
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 96
+
+# Only what render_card needs; the long prompt column stays in the database.
+CARD_COLUMNS = "id, subcategory, image_path, thumb_path, liked, favorited, options_json"
+SLIDE_COLUMNS = "id, subcategory, image_path"
+# Id lists go in as one JSON array bound to this, so each query is a single fixed SQL string:
+# the statement stays in sqlite3's prepared-statement cache whatever the list length.
+ID_SET = "(SELECT value FROM json_each(?))"
+
+@app.template_filter("options_dict")
+@lru_cache(maxsize=512)
+def options_dict_filter(options_json):
+    """Parsed once per distinct blob (cards repeat the same selections); read-only since it is shared."""
+    return MappingProxyType(loads_json(options_json or "{}"))
+
+@app.template_filter("mark_selected")
+def mark_selected_filter(option_tags, value):
+    if not value:
+        return option_tags
+    tag = f'<option value="{escape(value)}"'
+    return Markup(str(option_tags).replace(tag + ">", tag + " selected>", 1))
 
 @app.get("/gallery")
 def gallery():
     user = current_user()
     if not user:
         return redirect(url_for('session_gallery'))
+    ensure_batch_poller()  # resume polling queued batches after a restart
 
     conn = get_db()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT * FROM renderings WHERE user_id = ? ORDER BY created_at DESC", (user["id"],))
-    all_items = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
+    uid = user["id"]
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = min(max(request.args.get("size", GALLERY_PAGE_SIZE, type=int), 1), GALLERY_MAX_PAGE_SIZE)
     new_ids = session.pop('new_rendering_ids', [])
-    new_items = [item for item in all_items if item['id'] in new_ids]
-    main_items = [item for item in all_items if item['id'] not in new_ids]
-    
-    for item in all_items: item['options_dict'] = json.loads(item.get('options_json', '{}') or '{}')
-
-    fav_count = sum(1 for r in main_items if r.get("favorited"))
-    all_rooms = session.get('available_rooms', build_room_list(""))
-
-    return render_template("gallery.html", app_name=APP_NAME, user=user, items=main_items,
+    new_json = dumps_json(new_ids)
+    new_items = conn.execute(
+        f"SELECT {CARD_COLUMNS} FROM renderings WHERE user_id = ? AND id IN {ID_SET} ORDER BY created_at DESC",
+        (uid, new_json)).fetchall() if new_ids else []
+    # Both counts stay inside indexes: the total off idx_rend_user_created (no row lookups), and
+    # the slideshow only needs to know of two favorites, probed on the partial idx_rend_fav_created.
+    total, fav_count = conn.execute("""
+        SELECT (SELECT COUNT(*) FROM renderings WHERE user_id = ?),
+               (SELECT COUNT(*) FROM (SELECT 1 FROM renderings WHERE user_id = ? AND favorited = 1 LIMIT 2))
+    """, (uid, uid)).fetchone()
+    pages = max(-(-(total - len(new_items)) // size), 1)
+    page = min(page, pages)
+    # Left as a live cursor: the template's loop pulls rows as the response streams out.
+    # One page at a time, walked straight off idx_rend_user_created.
+    items = conn.execute(
+        f"SELECT {CARD_COLUMNS} FROM renderings WHERE user_id = ? AND id NOT IN {ID_SET} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+        (uid, new_json, size, size * (page - 1)))
+    all_rooms = session_rooms()
+    # The session cookie is written before a streamed body, so consume flashes now.
+    get_flashed_messages(with_categories=True)
+
+    return stream_template("gallery.html", app_name=APP_NAME, user=user, items=items,
                            new_items=new_items, show_slideshow=(fav_count >= 2),
-                           rooms=all_rooms, options=OPTIONS)
+                           page=page, pages=pages, size=size,
+                           rooms=all_rooms, option_selects=OPTION_SELECTS, options_json=OPTIONS_JSON)
 
 @app.get("/session_gallery")
 def session_gallery():
@@ -460,29 +1359,77 @@ def session_gallery():
     if guest_ids:
         conn = get_db()
         cur = conn.cursor()
-        q_marks = ",".join("?" for _ in guest_ids)
-        cur.execute(f"SELECT * FROM renderings WHERE id IN ({q_marks}) ORDER BY created_at DESC", guest_ids)
-        items = [dict(row) for row in cur.fetchall()]
-        conn.close()
-        
-    for item in items: item['options_dict'] = json.loads(item.get('options_json', '{}') or '{}')
+        cur.execute(f"SELECT {CARD_COLUMNS} FROM renderings WHERE id IN {ID_SET} ORDER BY created_at DESC", (dumps_json(guest_ids),))
+        items = cur.fetchall()
     
-    all_rooms = session.get('available_rooms', build_room_list(""))
+    all_rooms = session_rooms()
 
     return render_template("session_gallery.html", app_name=APP_NAME, user=user, items=items, 
-                           options=OPTIONS, rooms=all_rooms)
+                           option_selects=OPTION_SELECTS, options_json=OPTIONS_JSON, rooms=all_rooms)
 
 @app.post("/bulk_action")
 @login_required
 def bulk_action():
-    # (Implementation remains the same)
-    pass
+    action = request.form.get("action")
+    ids = [int(i) for i in request.form.getlist("rendering_ids") if i.isdigit()]
+    if not ids:
+        return jsonify({"error": "No renderings selected."}), 400
+
+    user_id = session["user_id"]
+    id_json = dumps_json(list(dict.fromkeys(ids)))
+    conn = get_db()
+    cur = conn.cursor()
+
+    if action == "delete":
+        cur.execute(f"DELETE FROM renderings WHERE id IN {ID_SET} AND user_id = ? RETURNING image_path, thumb_path", (id_json, user_id))
+        rows = cur.fetchall()
+        conn.commit()
+        _io_pool.submit(_rm_many, [STATIC_DIR / p for row in rows for p in row if p])
+        return jsonify({"message": f"Deleted {len(rows)} rendering(s)."})
+
+    if action in ("like", "favorite"):
+        field = "liked" if action == "like" else "favorited"
+        # Toggle in one statement; RETURNING hands back the stored values so the page shows the truth.
+        rows = cur.execute(f"UPDATE renderings SET {field} = 1 - {field} WHERE id IN {ID_SET} AND user_id = ? RETURNING id, {field}",
+                           (id_json, user_id)).fetchall()
+        conn.commit()
+        return jsonify({"message": f"Updated {len(rows)} rendering(s).", "state": {row[0]: row[1] for row in rows}})
+
+    if action == "download":
+        cur.execute(f"SELECT id, subcategory, image_path FROM renderings WHERE id IN {ID_SET} AND user_id = ?", (id_json, user_id))
+        entries = [(path, f"{secure_filename(sub) or 'rendering'}-{rid}.png") for rid, sub, path in cur.fetchall()]
+        return Response(stream_zip(entries), mimetype="application/zip",
+                        headers={"Content-Disposition": "attachment; filename=renderings.zip"})
+
+    if action == "email":
+        try:
+            to_email = validate_email(request.form.get("email", ""), check_deliverability=False).normalized
+        except EmailNotValidError as e:
+            return jsonify({"error": str(e)}), 400
+        if not MAIL_SERVER:
+            return jsonify({"error": "Email is not configured. Set MAIL_SERVER."}), 500
+        cur.execute(f"SELECT image_path, thumb_path FROM renderings WHERE id IN {ID_SET} AND user_id = ?", (id_json, user_id))
+        # Absolute URLs have to be built here, in the request; the email worker has no request context.
+        links = [(url_for("static", filename=full, _external=True), url_for("static", filename=thumb or full, _external=True))
+                 for full, thumb in cur.fetchall()]
+        _email_pool.submit(_send_email_in_background, to_email, f"Your {APP_NAME} renderings",
+                           f"Here are {len(links)} rendering(s) from {APP_NAME}.", links)
+        return jsonify({"message": f"Sending {len(links)} rendering(s) to {to_email}."}), 202
+
+    return jsonify({"error": "Unknown action."}), 400
 
 @app.get("/slideshow")
 @login_required
 def slideshow():
-    # (Implementation remains the same)
-    pass
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {SLIDE_COLUMNS} FROM renderings WHERE user_id = ? AND favorited = 1 ORDER BY created_at DESC", (session["user_id"],))
+    items = [dict(row) for row in cur.fetchall()]
+    if len(items) < 2:
+        flash("You need at least two favorites for a slideshow.", "info")
+        return redirect(url_for('gallery'))
+
+    return render_template("slideshow.html", app_name=APP_NAME, user=current_user(), items=items)
 
 @app.get("/session_slideshow")
 def session_slideshow():
@@ -493,10 +1440,8 @@ def session_slideshow():
     
     conn = get_db()
     cur = conn.cursor()
-    q_marks = ",".join("?" for _ in guest_ids)
-    cur.execute(f"SELECT * FROM renderings WHERE id IN ({q_marks})", guest_ids)
+    cur.execute(f"SELECT {SLIDE_COLUMNS} FROM renderings WHERE id IN {ID_SET}", (dumps_json(guest_ids),))
     items = [dict(row) for row in cur.fetchall()]
-    conn.close()
 
     return render_template("slideshow.html", app_name=APP_NAME, user=None, items=items)
 
@@ -509,65 +1454,154 @@ def modify_rendering(rid):
     user_id = session.get("user_id")
     guest_ids = session.get('guest_rendering_ids', [])
     
-    cur.execute("SELECT * FROM renderings WHERE id=?", (rid,))
+    cur.execute("SELECT id, user_id, category, subcategory, options_json FROM renderings WHERE id=?", (rid,))
     row = cur.fetchone()
     if not row:
-        conn.close(); return jsonify({"error": "Rendering not found."}), 404
+        return jsonify({"error": "Rendering not found."}), 404
     
     if row['user_id'] != user_id and (user_id or row['id'] not in guest_ids):
-        conn.close(); return jsonify({"error": "Permission denied."}), 403
+        return jsonify({"error": "Permission denied."}), 403
 
     subcategory = row["subcategory"]
-    original_options = json.loads(row["options_json"] or "{}")
-    selected = {opt: request.form.get(opt) or original_options.get(opt) for opt in OPTIONS.get(subcategory, {}).keys()}
+    original_options = loads_json(row["options_json"] or "{}")
+    selected = {opt: request.form.get(opt) or original_options.get(opt) for opt in OPTION_KEYS.get(subcategory, ())}
 
     prompt = build_prompt(subcategory, selected, description, False)
-    try:
-        rel_path = generate_image_via_openai(prompt)
-    except Exception as e:
-        conn.close(); return jsonify({"error": f"Modification failed: {e}"}), 500
-
-    now = datetime.utcnow().isoformat()
-    cur.execute("""
-        INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, row["category"], subcategory, json.dumps(selected), prompt, rel_path, now))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    
-    if not user_id:
-        guest_ids.append(new_id)
-        session['guest_rendering_ids'] = guest_ids
-
-    return jsonify({"id": new_id, "path": url_for('static', filename=rel_path), "subcategory": subcategory, "message": f"Modified {subcategory} rendering!"})
+    job_id = enqueue_render(user_id, row["category"], subcategory, selected, prompt,
+                            f"Modified {subcategory} rendering!", fresh=True)
+    return jsonify({"job_id": job_id, "message": f"Modifying {subcategory}..."}), 202
 
 # ---------- Auth Routes (Login, Register, Logout) ----------
+def claim_guest_renderings(user_id: int):
+    """Move this session's guest renderings onto the account that just signed in."""
+    guest_ids = session.pop('guest_rendering_ids', [])
+    if guest_ids:
+        conn = get_db()
+        conn.execute(f"UPDATE renderings SET user_id = ? WHERE user_id IS NULL AND id IN {ID_SET}", (user_id, dumps_json(guest_ids)))
+
+def sign_in(user_id: int, email: str, name: str):
+    """Start a signed-in session; the profile rides along so pages need no users query."""
+    session.permanent = True
+    session["user_id"] = user_id
+    session["user"] = {"id": user_id, "email": email, "name": name}
+    claim_guest_renderings(user_id)
+    # One commit for the claim and whatever the caller wrote first (new user row, rehashed password).
+    conn = g.get("_db")
+    if conn is not None and conn.in_transaction:
+        conn.commit()
+
+USER_CACHE_TTL = 300  # seconds
+
+def user_by_email(email: str):
+    """Profile (id, email, name) for an email, or None.
+
+    Found users are kept in the per-process cache for USER_CACHE_TTL; misses never are, since
+    the address may be registered through another worker at any moment. The password hash is
+    never cached: login reads it fresh, so a changed password takes effect in every worker at once.
+    """
+    key = f"user-by-email:{email}"
+    user = cache.get(key)
+    if user is None:
+        row = get_db().execute("SELECT id, email, name FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        cache.set(key, user, timeout=USER_CACHE_TTL)
+    return user
+
+_EMAIL_SPACE = str.maketrans("", "", " \t\r\n")
+
+def normalize_email(raw) -> str:
+    """Canonical form used to store and look up accounts: NFKC, no whitespace, lowercase."""
+    return unicodedata.normalize("NFKC", raw or "").translate(_EMAIL_SPACE).lower()
+
+def safe_next_url():
+    next_url = request.args.get("next") or ""
+    return next_url if next_url.startswith("/") and not next_url.startswith("//") else url_for("gallery")
+
 @app.route("/register", methods=["GET", "POST"])
+@cache.cached(timeout=300, unless=not_shareable, query_string=True)  # ?next= is baked into the form
 def register():
-    # (Implementation remains the same)
-    pass
+    if request.method == "POST":
+        email = normalize_email(request.form.get("email"))
+        name = (request.form.get("name") or "").strip()
+        password = request.form.get("password") or ""
+        if not email or not password:
+            flash("Email and password are required.", "danger")
+            return redirect(url_for("register"))
+
+        # Known addresses are turned away before paying for a hash (the page says so anyway);
+        # the insert itself still settles races through the UNIQUE index.
+        if user_by_email(email):
+            flash("That email is already registered. Please log in.", "warning")
+            return redirect(url_for("login"))
+        password_hash = generate_password_hash(password, method=PWHASH_METHOD)
+        conn = get_db()
+        row = conn.execute("""
+            INSERT INTO users (email, name, password_hash) VALUES (?, ?, ?)
+            ON CONFLICT(email) DO NOTHING RETURNING id
+        """, (email, name, password_hash)).fetchone()
+        if row is None:
+            flash("That email is already registered. Please log in.", "warning")
+            return redirect(url_for("login"))
+
+        sign_in(row[0], email, name)
+        flash("Account created!", "success")
+        return redirect(safe_next_url())
+    return render_template("register.html", app_name=APP_NAME, user=current_user())
 
 @app.route("/login", methods=["GET", "POST"])
+@cache.cached(timeout=300, unless=not_shareable, query_string=True)
 def login():
-    # (Implementation remains the same)
-    pass
+    if request.method == "POST":
+        email = normalize_email(request.form.get("email"))
+        password = request.form.get("password") or ""
+        user = get_db().execute("SELECT id, email, name, password_hash FROM users WHERE email = ?", (email,)).fetchone()
+        password_ok = check_password_hash(user["password_hash"] if user else DUMMY_PWHASH, password)
+        if user and password_ok:
+            if user["password_hash"].split("$", 1)[0] != PWHASH_PREFIX:
+                # Upgrade hashes made under an older PWHASH_METHOD while we have the plaintext.
+                password_hash = generate_password_hash(password, method=PWHASH_METHOD)
+                get_db().execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user["id"]))
+            sign_in(user["id"], user["email"], user["name"])
+            flash("Welcome back!", "success")
+            return redirect(safe_next_url())
+        flash("Invalid email or password.", "danger")
+    return render_template("login.html", app_name=APP_NAME, user=current_user())
 
 @app.get("/logout")
 def logout():
-    # (Implementation remains the same)
-    pass
+    session.pop("user_id", None)
+    session.pop("user", None)
+    flash("You have been logged out.", "info")
+    return redirect(url_for("index"))
 
 
 # ---------- Scaffolding and Main Execution ----------
-def write_template_files_if_missing():
-    (TEMPLATES_DIR / "layout.html").write_text("""<!doctype html>
+def write_if_changed(path: Path, body: str):
+    """Write only when missing or different, so unchanged files keep their mtime (and Jinja's cache)."""
+    data = body.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    # Swap in a finished file: workers booting side by side must never read (or hash) a half-written one.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+# Every page template, served straight from memory by a DictLoader (see below).
+TEMPLATE_SOURCES = {
+    "layout.html": """<!doctype html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
   <title>{{ app_name }}</title>
-  <link rel="stylesheet" href="{{ url_for('static', filename='app.css') }}">
+  <style>{{ critical_css }}</style>
+  <link rel="preload" href="{{ url_for('static', filename='app.css') }}" as="style" onload="this.onload=null;this.rel='stylesheet'">
+  <noscript><link rel="stylesheet" href="{{ url_for('static', filename='app.css') }}"></noscript>
 </head>
 <body>
   <div id="loadingOverlay">
@@ -609,12 +1643,13 @@ def write_template_files_if_missing():
   <script>
     const IS_LOGGED_IN = {{ 'true' if user else 'false' }};
   </script>
-  <script src="{{ url_for('static', filename='app.js') }}"></script>
+  <script src="{{ url_for('static', filename='app.js') }}" defer></script>
+  {% block scripts %}{% endblock %}
 </body>
 </html>
-""", encoding="utf-8")
+""",
 
-    (TEMPLATES_DIR / "index.html").write_text("""{% extends "layout.html" %}{% block content %}
+    "index.html": """{% extends "layout.html" %}{% block content %}
 <div class="landing-content">
   <h1>Design Your Dream Home with AI</h1>
   <p>Bring your vision to life. Describe your ideal home, and our AI will generate stunning, photorealistic renderings in moments.</p>
@@ -647,17 +1682,18 @@ def write_template_files_if_missing():
   </div>
 </div>
 {% endblock %}
-""", encoding="utf-8")
-    
-    (TEMPLATES_DIR / "gallery.html").write_text("""{% extends "layout.html" %}
-{% from "macros.html" import render_card %}
+{% block scripts %}<script src="{{ url_for('static', filename='voice.js') }}" defer></script>{% endblock %}
+""",
+
+    "gallery.html": """{% extends "layout.html" %}
+{% from "macros.html" import render_grid %}
 {% block content %}
 <h1>My Renderings</h1>
 {% if new_items %}
 <div class="card">
   <h2>Newly Generated</h2>
   <div class="grid">
-    {% for r in new_items %}{{ render_card(r, options, user) }}{% endfor %}
+    {{ render_grid(new_items, option_selects, user) }}
   </div>
 </div>
 {% endif %}
@@ -668,14 +1704,26 @@ def write_template_files_if_missing():
             <button id="likeBtn">❤️ Like</button>
             <button id="favBtn">⭐ Favorite</button>
             <button id="deleteBtn">🗑️ Delete</button>
+            <button id="downloadBtn">⬇️ Download</button>
+        </div>
+        <div>
+            <input type="email" id="emailTo" placeholder="Email selected to...">
+            <button id="emailBtn">✉️ Email</button>
         </div>
     </div>
     {% if show_slideshow %}<a href="{{ url_for('slideshow') }}" class="button primary">▶️ View Favorites Slideshow</a>{% endif %}
 </div>
 <h3>All My Renderings</h3>
 <div id="renderingsGrid" class="grid">
-    {% for r in items %}{{ render_card(r, options, user) }}{% endfor %}
+    {{ render_grid(items, option_selects, user) }}
 </div>
+{% if pages > 1 %}
+<div class="row gap center pager">
+    {% if page > 1 %}<a class="button" href="{{ url_for('gallery', page=page - 1, size=size) }}">❮ Newer</a>{% endif %}
+    <span>Page {{ page }} of {{ pages }}</span>
+    {% if page < pages %}<a class="button" href="{{ url_for('gallery', page=page + 1, size=size) }}">Older ❯</a>{% endif %}
+</div>
+{% endif %}
 <div class="card">
     <h2>Generate a New Room</h2>
     <form id="generateRoomForm">
@@ -683,18 +1731,20 @@ def write_template_files_if_missing():
             {% for room in rooms %}<option value="{{ room }}">{{ room }}</option>{% endfor %}
         </select>
         <div id="roomOptionsContainer"></div>
+        <label><input type="checkbox" name="batch"> Batch: half price, ready within 24h</label>
         <button type="submit" class="primary">Generate Room</button>
     </form>
 </div>
 <div id="imageModal" class="modal"><span class="close-modal">&times;</span><img class="modal-content" id="modalImg"></div>
 <script>
-    const ROOM_OPTIONS = {{ options | tojson }};
+    const ROOM_OPTIONS = {{ options_json }};
 </script>
 {% endblock %}
-""", encoding="utf-8")
+{% block scripts %}<script src="{{ url_for('static', filename='gallery.js') }}" defer></script>{% endblock %}
+""",
 
-    (TEMPLATES_DIR / "session_gallery.html").write_text("""{% extends "layout.html" %}
-{% from "macros.html" import render_card %}
+    "session_gallery.html": """{% extends "layout.html" %}
+{% from "macros.html" import render_grid %}
 {% block content %}
 <h1>Your Current Session</h1>
 <div class="card info">
@@ -709,7 +1759,7 @@ def write_template_files_if_missing():
   </div>
   {% endif %}
 <div id="renderingsGrid" class="grid">
-    {% for r in items %}{{ render_card(r, options, user) }}{% endfor %}
+    {{ render_grid(items, option_selects, user) }}
 </div>
 {% else %}
 <div class="card">
@@ -728,19 +1778,20 @@ def write_template_files_if_missing():
 </div>
 <div id="imageModal" class="modal"><span class="close-modal">&times;</span><img class="modal-content" id="modalImg"></div>
 <script>
-    const ROOM_OPTIONS = {{ options | tojson }};
+    const ROOM_OPTIONS = {{ options_json }};
 </script>
 {% endblock %}
-""", encoding="utf-8")
+{% block scripts %}<script src="{{ url_for('static', filename='gallery.js') }}" defer></script>{% endblock %}
+""",
 
-    (TEMPLATES_DIR / "slideshow.html").write_text("""{% extends "layout.html" %}
+    "slideshow.html": """{% extends "layout.html" %}
 {% block content %}
 <div class="slideshow-container">
   <h1>Slideshow</h1>
   <div class="slideshow">
     {% for r in items %}
-      <div class="slide" {% if not loop.first %}style="display:none;"{% endif %}>
-        <img src="{{ url_for('static', filename=r['image_path']) }}" alt="{{ r['subcategory'] }}" class="render-img">
+      <div class="slide{% if loop.first %} active{% endif %}">
+        <img src="{{ url_for('static', filename=r['image_path']) }}" alt="{{ r['subcategory'] }}" class="render-img" width="1024" height="1024" decoding="async"{% if not loop.first %} loading="lazy"{% endif %}>
         <div class="caption">{{ r['subcategory'] }}</div>
       </div>
     {% endfor %}
@@ -753,30 +1804,59 @@ def write_template_files_if_missing():
   </div>
 </div>
 <script>
-  const slides=[...document.querySelectorAll('.slide')];
+  const slides=document.querySelector('.slideshow').children;  // live HTMLCollection, no copy
   let idx=0;
-  function show(i){slides.forEach((s,j)=>s.style.display=(i===j?'block':'none'));}
-  document.getElementById('prev').onclick=()=>{idx=(idx-1+slides.length)%slides.length;show(idx);}
-  document.getElementById('next').onclick=()=>{idx=(idx+1)%slides.length;show(idx);}
+  // Only the outgoing and incoming slides change, batched into the next frame.
+  function go(delta){
+    const prev=slides[idx];
+    idx=(idx+delta+slides.length)%slides.length;
+    const next=slides[idx];
+    requestAnimationFrame(()=>{prev.classList.remove('active');next.classList.add('active');});
+  }
+  document.getElementById('prev').onclick=()=>go(-1);
+  document.getElementById('next').onclick=()=>go(1);
   document.getElementById('toggleDark').onclick=()=>{
       const currentImg = slides[idx].querySelector('.render-img');
       if (currentImg) currentImg.classList.toggle('dark');
   };
 </script>
 {% endblock %}
-""", encoding="utf-8")
+""",
+
+    "login.html": """{% extends "layout.html" %}{% block content %}
+<form class="card auth-form" method="post" action="{{ url_for('login', next=request.args.get('next')) }}">
+  <h1>Log In</h1>
+  <label>Email <input type="email" name="email" required autofocus></label>
+  <label>Password <input type="password" name="password" required></label>
+  <button class="primary" type="submit">Log In</button>
+  <p>No account yet? <a href="{{ url_for('register', next=request.args.get('next')) }}">Register</a></p>
+</form>
+{% endblock %}
+""",
+
+    "register.html": """{% extends "layout.html" %}{% block content %}
+<form class="card auth-form" method="post" action="{{ url_for('register', next=request.args.get('next')) }}">
+  <h1>Create an Account</h1>
+  <label>Name <input type="text" name="name"></label>
+  <label>Email <input type="email" name="email" required></label>
+  <label>Password <input type="password" name="password" required minlength="8"></label>
+  <button class="primary" type="submit">Register</button>
+  <p>Already have an account? <a href="{{ url_for('login', next=request.args.get('next')) }}">Log in</a></p>
+</form>
+{% endblock %}
+""",
 
-    (TEMPLATES_DIR / "macros.html").write_text("""
-{% macro render_card(r, options, user) %}
+    "macros.html": """
+{% macro render_card(r, option_selects, user) %}
 <div class="render-card" data-id="{{ r['id'] }}">
     {% if user %}<input type="checkbox" name="rendering_id" class="rendering-checkbox">{% endif %}
-    <img src="{{ url_for('static', filename=r['image_path']) }}" alt="{{ r['subcategory'] }}" class="render-img modal-trigger">
+    <img src="{{ url_for('static', filename=r['thumb_path'] or r['image_path']) }}" data-full="{{ url_for('static', filename=r['image_path']) }}" alt="{{ r['subcategory'] }}" class="render-img modal-trigger" width="1024" height="1024" loading="lazy" decoding="async">
     <div class="meta">
         <span class="tag">{{ r['subcategory'] }}</span>
         <div class="actions">
             <button class="action-btn like-btn {% if r['liked'] %}active{% endif %}" title="Like">❤️</button>
             <button class="action-btn fav-btn {% if r['favorited'] %}active{% endif %}" title="Favorite">⭐</button>
-            <button class="action-btn dark-toggle" title="Toggle Dark Mode">🌙</button>
+            <input type="checkbox" class="dark-toggle-cb" id="dark{{ r['id'] }}"><label for="dark{{ r['id'] }}" class="action-btn dark-toggle" title="Toggle Dark Mode">🌙</label>
         </div>
     </div>
     <div class="modify-section">
@@ -784,15 +1864,12 @@ def write_template_files_if_missing():
             <summary>Modify This Rendering</summary>
             <form class="modify-form" data-id="{{ r['id'] }}">
                 <textarea name="description" rows="2" placeholder="Describe changes... e.g., 'make the siding dark blue'"></textarea>
-                {% if options[r['subcategory']] %}
+                {% if option_selects[r['subcategory']] %}
+                {% set chosen = r['options_json']|options_dict %}
                 <div class="options-grid">
-                  {% for opt, vals in options[r['subcategory']].items() %}
+                  {% for opt, tags in option_selects[r['subcategory']] %}
                   <label>{{ opt }}
-                    <select name="{{ opt }}">
-                      {% set current_val = r['options_dict'].get(opt) %}
-                      <option value="">-- Default --</option>
-                      {% for v in vals %}<option value="{{ v }}" {% if v == current_val %}selected{% endif %}>{{ v }}</option>{% endfor %}
-                    </select>
+                    <select name="{{ opt }}">{{ tags|mark_selected(chosen.get(opt)) }}</select>
                   </label>
                   {% endfor %}
                 </div>
@@ -803,10 +1880,17 @@ def write_template_files_if_missing():
     </div>
 </div>
 {% endmacro %}
-""", encoding="utf-8")
 
-def write_basic_static_if_missing():
-    (STATIC_DIR / "app.css").write_text("""
+{% macro render_grid(items, option_selects, user) %}{% for r in items %}{{ render_card(r, option_selects, user) }}{% endfor %}{% endmacro %}
+""",
+}
+
+# Templates never touch the filesystem: a lookup is a dict hit, compiled code comes from the
+# env cache / bytecode cache.
+app.jinja_loader = DictLoader(TEMPLATE_SOURCES)
+
+# First-paint rules, inlined into layout.html so no page blocks on fetching app.css.
+CRITICAL_CSS_SRC = """
 :root { --bg: #f4f7fa; --text: #1a202c; --card-bg: #fff; --border: #e2e8f0; --primary: #4a6dff; --primary-text: #fff; }
 body { margin: 0; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background-color: var(--bg); color: var(--text); line-height: 1.6; }
 .container { max-width: 1200px; margin: 2rem auto; padding: 0 1rem; }
@@ -817,21 +1901,47 @@ body { margin: 0; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Ro
 .card { background-color: var(--card-bg); border: 1px solid var(--border); border-radius: 8px; padding: 1.5rem; margin-bottom: 1.5rem; }
 .button, button { background-color: #e2e8f0; color: #2d3748; border: none; padding: 0.75rem 1rem; border-radius: 6px; cursor: pointer; font-weight: bold; text-decoration: none; display: inline-block; }
 .button.primary, button.primary { background-color: var(--primary); color: var(--primary-text); }
+.flash { padding: 1rem; margin-bottom: 1rem; border-radius: 6px; }
+.flash.success { background-color: #c6f6d5; color: #22543d; }
+.flash.danger { background-color: #fed7d7; color: #822727; }
+.flash.warning, .flash.info { background-color: #bee3f8; color: #2c5282; }
+#loadingOverlay { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.7); z-index: 9999; color: white; text-align: center; justify-content: center; align-items: center; flex-direction: column; }
+/* Layout and visibility for first paint: app.css loads async, so without these cards paint at their
+   1024px intrinsic size and hidden slides/modals show until it arrives. */
+.grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(300px, 1fr)); gap: 1rem; }
+.landing-grid { display: grid; grid-template-columns: 2fr 1fr; gap: 2rem; text-align: left; margin-top: 2rem; }
+.render-card { position: relative; border: 1px solid var(--border); border-radius: 8px; overflow: hidden; }
+.render-img { width: 100%; height: auto; display: block; aspect-ratio: 1/1; object-fit: cover; cursor: pointer; }
+.dark-toggle-cb { position: absolute; opacity: 0; pointer-events: none; }
+.modal { display: none; position: fixed; z-index: 1000; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.9); }
+.slideshow-container, .slide { text-align: center; }
+.slide { display: none; }
+.slide.active { display: block; }
+.slide img { max-width: 100%; max-height: 70vh; border-radius: 8px; }
+@media (max-width: 768px) { .landing-grid { grid-template-columns: 1fr; } }
+"""
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{}:;,])\s*", r"\1", css).replace(";}", "}").strip()
+
+app.jinja_env.globals["critical_css"] = Markup(minify_css(CRITICAL_CSS_SRC))
+
+def write_basic_static_if_missing():
+    write_if_changed(STATIC_DIR / "app.css", """
 .row { display: flex; align-items: center; }
 .gap > * { margin-right: 0.5rem; }
 .center { justify-content: center; }
-.grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(300px, 1fr)); gap: 1rem; }
+.pager { margin: 1rem 0 1.5rem; }
 .landing-content { max-width: 1000px; margin: 2rem auto; text-align: center; }
-.landing-grid { display: grid; grid-template-columns: 2fr 1fr; gap: 2rem; text-align: left; margin-top: 2rem; }
 .landing-column .card { height: 100%; box-sizing: border-box; }
 .pill-list { list-style: none; padding: 0; display: flex; flex-wrap: wrap; gap: 0.5rem; }
 .pill-list li { background: #edf2f7; padding: 0.25rem 0.75rem; border-radius: 99px; font-size: 0.9em; }
 .button-outline { background-color: transparent; border: 1px solid var(--primary); color: var(--primary) !important; padding: 0.5rem 1rem; }
 .badge { background-color: var(--primary); color: var(--primary-text); font-size: 0.75em; padding: 2px 6px; border-radius: 8px; margin-left: 4px; }
 .info { background-color: #bee3f8; color: #2c5282; padding: 1rem; border-radius: 6px; }
-.render-card { position: relative; border: 1px solid var(--border); border-radius: 8px; overflow: hidden; }
-.render-img { width: 100%; height: auto; display: block; aspect-ratio: 1/1; object-fit: cover; cursor: pointer; }
-.render-img.dark { filter: brightness(0.6) contrast(1.2); }
+.render-img.dark, .render-card:has(.dark-toggle-cb:checked) .render-img { filter: brightness(0.6) contrast(1.2); }
 .meta { display: flex; justify-content: space-between; align-items: center; padding: 0.5rem; }
 .actions { display: flex; gap: 0.5rem; }
 .action-btn { background: none; border: none; font-size: 1.2rem; cursor: pointer; padding: 0; }
@@ -839,27 +1949,92 @@ body { margin: 0; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Ro
 .rendering-checkbox { position: absolute; top: 10px; left: 10px; width: 20px; height: 20px; z-index: 10; }
 .modify-section details { margin-top: 0.5rem; }
 .options-grid { display: grid; grid-template-columns: 1fr 1fr; gap: 1rem; margin-top: 1rem; }
-.modal { display: none; position: fixed; z-index: 1000; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.9); }
 .modal-content { margin: auto; display: block; max-width: 90%; max-height: 90%; }
 .close-modal { position: absolute; top: 15px; right: 35px; color: #f1f1f1; font-size: 40px; font-weight: bold; cursor: pointer; }
-.slideshow-container, .slide { text-align: center; }
-.slide img { max-width: 100%; max-height: 70vh; border-radius: 8px; }
-.flash { padding: 1rem; margin-bottom: 1rem; border-radius: 6px; }
-.flash.success { background-color: #c6f6d5; color: #22543d; }
-.flash.danger { background-color: #fed7d7; color: #822727; }
-#loadingOverlay { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.7); z-index: 9999; color: white; text-align: center; justify-content: center; align-items: center; flex-direction: column; }
+.auth-form { max-width: 420px; margin: 2rem auto; display: flex; flex-direction: column; gap: 1rem; }
+.auth-form label { display: flex; flex-direction: column; }
 .loading-content { background: #333; padding: 2rem; border-radius: 8px; }
-@media (max-width: 768px) { .landing-grid { grid-template-columns: 1fr; } }
-    """, encoding="utf-8")
+    """)
     
-    (STATIC_DIR / "app.js").write_text("""
+    write_if_changed(STATIC_DIR / "app.js", """
+
+document.addEventListener('DOMContentLoaded', function() {
+    // --- Index Page Logic (Loading Overlay; voice input lives in voice.js) ---
+    const generateForm = document.getElementById('generateForm');
+    if (generateForm) {
+        generateForm.addEventListener('submit', async function(e) {
+            e.preventDefault();
+            const description = document.getElementById('description');
+            if (!description.value.trim()) {
+                alert('Please provide a home description before generating.');
+                return;
+            }
+            const overlay = document.getElementById('loadingOverlay');
+            overlay.style.display = 'flex';
+            try {
+                const response = await fetch(generateForm.action, {
+                    method: 'POST', body: new FormData(generateForm), headers: { Accept: 'application/json' },
+                });
+                const result = await response.json();
+                if (!response.ok) throw new Error(result.error);
+                const outcomes = await Promise.allSettled(result.job_ids.map(waitForJob));
+                const failed = outcomes.filter(o => o.status === 'rejected');
+                if (failed.length === outcomes.length) throw failed[0].reason;
+                if (failed.length) showFlash(failed[0].reason.message, 'danger');
+                setTimeout(() => { window.location.href = result.next; }, failed.length ? 1500 : 0);
+            } catch (error) {
+                showFlash(error.message, 'danger');
+                overlay.style.display = 'none';
+            }
+        });
+    }
+});
+
+function requireLogin(action_text = 'save your work') {
+    if (!IS_LOGGED_IN) {
+        if (confirm(`Please log in or register to ${action_text}. Would you like to go to the login page?`)) {
+            window.location.href = '/login?next=' + window.location.pathname;
+        }
+        return true;
+    }
+    return false;
+}
+
+// Render jobs (rooms, modifications, landing-page exteriors) are polled until they finish.
+// The server fails jobs that outlive their deadline; the cap here only covers an unreachable server.
+const JOB_TIMEOUT_MS = 20 * 60 * 1000;
+
+async function waitForJob(jobId) {
+    const giveUpAt = Date.now() + JOB_TIMEOUT_MS;
+    while (Date.now() < giveUpAt) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        const response = await fetch(`/job/${jobId}`);
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        if (result.status === 'done') return result;
+    }
+    throw new Error('Rendering timed out. Please try again.');
+}
+
+function showFlash(message, category) {
+    const container = document.getElementById('flash-container');
+    const flash = document.createElement('div');
+    flash.className = `flash ${category}`;
+    flash.textContent = message;
+    container.prepend(flash);
+    setTimeout(() => flash.remove(), 5000);
+}
+""")
+
+    # Gallery-only behaviour; loaded just by the two gallery templates.
+    write_if_changed(STATIC_DIR / "gallery.js", """
 document.addEventListener('DOMContentLoaded', function() {
-    // --- Universal Modal Logic ---
+    // --- Image Modal Logic ---
     const modal = document.getElementById('imageModal');
     if (modal) {
         document.addEventListener('click', e => {
             if (e.target.classList.contains('modal-trigger')) {
-                modal.style.display = 'block'; document.getElementById('modalImg').src = e.target.src;
+                modal.style.display = 'block'; document.getElementById('modalImg').src = e.target.dataset.full || e.target.src;
             }
             if (e.target.classList.contains('close-modal')) {
                 modal.style.display = 'none';
@@ -868,31 +2043,6 @@ document.addEventListener('DOMContentLoaded', function() {
         window.addEventListener('click', e => { if (e.target === modal) modal.style.display = 'none'; });
     }
 
-    // --- Index Page Logic (Voice & Loading Overlay) ---
-    const generateForm = document.getElementById('generateForm');
-    if (generateForm) {
-        generateForm.addEventListener('submit', function(e) {
-            const description = document.getElementById('description');
-            if (!description.value.trim()) {
-                alert('Please provide a home description before generating.');
-                e.preventDefault();
-                return;
-            }
-            document.getElementById('loadingOverlay').style.display = 'flex';
-        });
-
-        const voiceBtn = document.getElementById('voiceBtn');
-        const description = document.getElementById('description');
-        const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
-        if (SpeechRecognition) {
-            const recognition = new SpeechRecognition();
-            recognition.onresult = (event) => { description.value = event.results[0][0].transcript; };
-            voiceBtn.addEventListener('click', () => recognition.start());
-        } else {
-            voiceBtn.style.display = 'none';
-        }
-    }
-    
     // --- Gallery / Session Gallery Page Logic ---
     const gridContainer = document.getElementById('renderingsGrid');
     if (gridContainer) {
@@ -900,30 +2050,23 @@ document.addEventListener('DOMContentLoaded', function() {
         const roomSelect = document.getElementById('roomSelect');
         const roomOptionsContainer = document.getElementById('roomOptionsContainer');
         
+        // One markup string per room, built on first use and parsed in a single innerHTML pass.
+        const optionsHtml = {};
         function updateRoomOptions() {
             if (!roomSelect) return;
             const subcategory = roomSelect.value;
             const options = ROOM_OPTIONS[subcategory];
-            roomOptionsContainer.innerHTML = '';
-            if (options) {
-                const container = document.createElement('div');
-                container.className = 'options-grid';
+            if (options && !(subcategory in optionsHtml)) {
+                const parts = ['<div class="options-grid">'];
                 for (const [opt, vals] of Object.entries(options)) {
-                    const label = document.createElement('label');
-                    label.textContent = opt;
-                    const select = document.createElement('select');
-                    select.name = opt;
-                    vals.forEach(v => {
-                        const option = document.createElement('option');
-                        option.value = v;
-                        option.textContent = v;
-                        select.appendChild(option);
-                    });
-                    label.appendChild(select);
-                    container.appendChild(label);
+                    parts.push(`<label>${escapeHtml(opt)}<select name="${escapeHtml(opt)}">`);
+                    for (const v of vals) parts.push(`<option value="${escapeHtml(v)}">${escapeHtml(v)}</option>`);
+                    parts.push('</select></label>');
                 }
-                roomOptionsContainer.appendChild(container);
+                parts.push('</div>');
+                optionsHtml[subcategory] = parts.join('');
             }
+            roomOptionsContainer.innerHTML = options ? optionsHtml[subcategory] : '';
         }
         
         if (roomSelect) {
@@ -931,11 +2074,74 @@ document.addEventListener('DOMContentLoaded', function() {
             updateRoomOptions();
         }
         
+        const selectAll = document.getElementById('selectAll');
+        if (selectAll) {
+            selectAll.addEventListener('change', () => {
+                document.querySelectorAll('.rendering-checkbox').forEach(cb => cb.checked = selectAll.checked);
+            });
+            const selectedIds = () => [...document.querySelectorAll('.rendering-checkbox:checked')].map(cb => cb.closest('.render-card').dataset.id);
+            [['likeBtn', 'like'], ['favBtn', 'favorite'], ['deleteBtn', 'delete']].forEach(([btnId, action]) => {
+                document.getElementById(btnId).addEventListener('click', () => {
+                    const ids = selectedIds();
+                    if (!ids.length) return showFlash('Select at least one rendering.', 'danger');
+                    if (action === 'delete' && !confirm(`Delete ${ids.length} rendering(s)?`)) return;
+                    handleBulkAction(action, ids).then(() => window.location.reload());
+                });
+            });
+            document.getElementById('downloadBtn').addEventListener('click', () => {
+                const ids = selectedIds();
+                if (!ids.length) return showFlash('Select at least one rendering.', 'danger');
+                // A plain form post: the attachment goes to the browser's download manager and streams
+                // to disk, rather than being held in memory as a Blob until the last byte arrives.
+                const form = document.createElement('form');
+                form.method = 'POST';
+                form.action = '/bulk_action';
+                for (const [name, value] of bulkBody('download', ids)) {
+                    const input = document.createElement('input');
+                    input.type = 'hidden';
+                    input.name = name;
+                    input.value = value;
+                    form.appendChild(input);
+                }
+                document.body.appendChild(form);
+                form.submit();
+                form.remove();
+            });
+            document.getElementById('emailBtn').addEventListener('click', () => {
+                const ids = selectedIds();
+                if (!ids.length) return showFlash('Select at least one rendering.', 'danger');
+                handleBulkAction('email', ids, { email: document.getElementById('emailTo').value }).catch(() => {});
+            });
+        }
+
         document.body.addEventListener('submit', handleFormSubmit);
         document.body.addEventListener('click', handleCardClick);
     }
 });
 
+const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+function escapeHtml(str) {
+    return String(str).replace(/[&<>"']/g, c => HTML_ESCAPES[c]);
+}
+
+// Compact urlencoded body (no multipart boundaries); fetch sets the Content-Type itself.
+function bulkBody(action, ids, extra = {}) {
+    const body = new URLSearchParams({ action, ...extra });
+    ids.forEach(id => body.append('rendering_ids', id));
+    return body;
+}
+
+async function handleBulkAction(action, ids, extra = {}) {
+    const response = await fetch('/bulk_action', { method: 'POST', body: bulkBody(action, ids, extra) });
+    const result = await response.json();
+    if (!response.ok) {
+        showFlash(result.error, 'danger');
+        throw new Error(result.error);
+    }
+    showFlash(result.message, 'success');
+    return result;
+}
+
 function handleFormSubmit(e) {
     if (e.target.classList.contains('modify-form')) {
         e.preventDefault();
@@ -948,18 +2154,15 @@ function handleFormSubmit(e) {
 }
 
 function handleCardClick(e) {
-    const card = e.target.closest('.render-card');
-    if (!card) return;
-
-    if (e.target.classList.contains('like-btn') || e.target.classList.contains('fav-btn')) {
-        if (requireLogin('save likes and favorites')) return;
-        const action = e.target.classList.contains('like-btn') ? 'like' : 'favorite';
-        handleBulkAction(action, [card.dataset.id]).then(() => e.target.classList.toggle('active'));
-    } else if (e.target.classList.contains('dark-toggle')) {
-        card.querySelector('.render-img').classList.toggle('dark');
-    }
+    const btn = e.target.closest('.render-card .like-btn, .render-card .fav-btn');
+    if (!btn) return;
+    if (requireLogin('save likes and favorites')) return;
+    const action = btn.classList.contains('like-btn') ? 'like' : 'favorite';
+    const id = btn.closest('.render-card').dataset.id;
+    handleBulkAction(action, [id]).then(result => btn.classList.toggle('active', !!result.state[id]));
 }
 
+// Renders run server-side in the background; poll until the job settles.
 async function modifyRendering(form) {
     const id = form.dataset.id;
     const formData = new FormData(form);
@@ -972,7 +2175,7 @@ async function modifyRendering(form) {
         const response = await fetch(`/modify_rendering/${id}`, { method: 'POST', body: formData });
         const result = await response.json();
         if (!response.ok) throw new Error(result.error);
-        showFlash(result.message, 'success');
+        showFlash((await waitForJob(result.job_id)).message, 'success');
         setTimeout(() => window.location.reload(), 1500);
     } catch (error) {
         showFlash(error.message, 'danger');
@@ -983,7 +2186,31 @@ async function modifyRendering(form) {
     }
 }
 
+// Batch API jobs come back through the poller (up to 24h), so just confirm the queueing.
+async function queueRoomBatch(form) {
+    const { subcategory, batch, ...options } = Object.fromEntries(new FormData(form));
+    const button = form.querySelector('button');
+    button.textContent = 'Queuing...';
+    button.disabled = true;
+
+    try {
+        const response = await fetch('/queue_batch', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ jobs: [{ subcategory, options }] }),
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        showFlash(result.message, 'success');
+    } catch (error) {
+        showFlash(error.message, 'danger');
+    } finally {
+        button.textContent = 'Generate Room';
+        button.disabled = false;
+    }
+}
+
 async function generateNewRoom(form) {
+    if (form.elements.batch?.checked) return queueRoomBatch(form);
     const formData = new FormData(form);
     const button = form.querySelector('button');
     button.textContent = 'Generating...';
@@ -994,7 +2221,7 @@ async function generateNewRoom(form) {
         const response = await fetch('/generate_room', { method: 'POST', body: formData });
         const result = await response.json();
         if (!response.ok) throw new Error(result.error);
-        showFlash(result.message, 'success');
+        showFlash((await waitForJob(result.job_id)).message, 'success');
         setTimeout(() => window.location.reload(), 1500);
     } catch (error) {
         showFlash(error.message, 'danger');
@@ -1004,27 +2231,67 @@ async function generateNewRoom(form) {
         button.disabled = false;
     }
 }
-
-function requireLogin(action_text = 'save your work') {
-    if (!IS_LOGGED_IN) {
-        if (confirm(`Please log in or register to ${action_text}. Would you like to go to the login page?`)) {
-            window.location.href = '/login?next=' + window.location.pathname;
-        }
-        return true;
+""")
+
+    # Only index.html loads this, so other pages never parse it or construct a recognizer.
+    write_if_changed(STATIC_DIR / "voice.js", """
+(function () {
+    const voiceBtn = document.getElementById('voiceBtn');
+    if (!voiceBtn) return;
+    const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+    if (!SpeechRecognition) {
+        voiceBtn.style.display = 'none';
+        return;
     }
-    return false;
-}
+    const description = document.getElementById('description');
+    let recognition;
+    voiceBtn.addEventListener('click', () => {
+        if (!recognition) {
+            recognition = new SpeechRecognition();
+            recognition.onresult = (event) => { description.value = event.results[0][0].transcript; };
+        }
+        recognition.start();
+    });
+})();
+""")
 
-function showFlash(message, category) {
-    const container = document.getElementById('flash-container');
-    const flash = document.createElement('div');
-    flash.className = `flash ${category}`;
-    flash.textContent = message;
-    container.prepend(flash);
-    setTimeout(() => flash.remove(), 5000);
-}
-""", encoding="utf-8")
 
+@app.cli.command("init")
+def init_command():
+    """Create folders, static assets and tables."""
+    init_fs_once()
+    with app.app_context():
+        init_db_once()
+    print("Initialized.")
+
+@app.cli.command("sweep")
+def sweep_command():
+    """Delete rendering files no row points at (interrupted background deletes, failed inserts),
+    prompt-cache entries unused for PROMPT_CACHE_DAYS, and abandoned render jobs."""
+    with app.app_context():
+        conn = get_db()
+        referenced = {p for row in conn.execute("SELECT image_path, thumb_path FROM renderings") for p in row if p}
+        jobs = prune_render_jobs(conn)
+        conn.commit()
+    cutoff = time.time() - 3600  # leave files a render in flight may not have recorded yet
+    orphans = [p for p in RENDER_DIR.iterdir()
+               if p.suffix in (".png", ".webp") and f"renderings/{p.name}" not in referenced and p.stat().st_mtime < cutoff]
+    # A cache entry's mtime is its last use (cached_rendering touches it on every hit). Age, not link
+    # count, decides: entries are plain copies wherever hard links aren't possible.
+    cache_cutoff = time.time() - PROMPT_CACHE_DAYS * 86400
+    stale = [p for p in PROMPT_CACHE_DIR.iterdir() if p.is_file() and p.stat().st_mtime < cache_cutoff]
+    _rm_many(orphans + stale)
+    print(f"Removed {len(orphans)} orphaned file(s), {len(stale)} unused prompt-cache entr{'y' if len(stale) == 1 else 'ies'} "
+          f"and {jobs} abandoned render job(s).")
+
+init_fs_once()
+with app.app_context():
+    init_db_once()
+# SQLite handles must not cross a fork: with gunicorn --preload each worker opens its own pool.
+close_pooled_dbs()
+# Compile every template up front; with gunicorn --preload, workers fork with them ready to render.
+for name in TEMPLATE_SOURCES:
+    app.jinja_env.get_template(name)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=True)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=os.getenv("FLASK_DEBUG") in ("1", "true", "True"))